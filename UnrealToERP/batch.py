@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import argparse
+import contextlib
+import csv
+import importlib
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from shelf_cache import load_shelves
+from shelf_index import GEOMETRY_BACKENDS
+from output_writers import OUTPUT_FORMATS
+
+# Runs one of the parsers on many scenes. The manifest has one scene per
+# line, items CSV|shelves CSV|output JSON, relative paths are relative to the
+# manifest. Every distinct shelf layout is built once into the shelf model
+# cache before the scenes are distributed over the process pool, so scenes
+# with the same layout load it from the cache. The messages of every scene go
+# to its output path with .log appended, its run report to .report.json.
+
+PARSERS = ('UnrealToERP', 'UnrealToERP_2')
+
+def read_manifest(manifest):
+  base = os.path.dirname(os.path.abspath(manifest))
+  scenes = []
+  with open(manifest, mode='r') as csv_file:
+    csv_reader = csv.reader(csv_file, delimiter='|')
+    for data in csv_reader:
+      if not data or not ''.join(data).strip() or data[0].startswith('#'):
+        continue
+      if len(data) != 3:
+        raise ValueError('Invalid scene in ' + manifest + ': ' + '|'.join(data))
+      scenes.append(tuple(os.path.join(base, path.strip()) for path in data))
+  return scenes
+
+def warm_shelf_cache(parser, scenes, backend='shapely'):
+  # Build every distinct shelf layout once, failures are reported by the scenes using it
+  module = importlib.import_module(parser)
+  for csv_shelves in sorted(set(scene[1] for scene in scenes)):
+    try:
+      with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        load_shelves(csv_shelves, module.csv_to_shelves, backend)
+    except Exception:
+      pass
+
+def run_scene(task):
+  # (scene number, error or None, seconds) of one scene
+  parser, output_format, backend, number, (csv_items, csv_shelves, output) = task
+  start = time.time()
+  try:
+    module = importlib.import_module(parser)
+    if os.path.dirname(output) and not os.path.isdir(os.path.dirname(output)):
+      os.makedirs(os.path.dirname(output))
+    with open(output + '.log', 'w') as log, contextlib.redirect_stdout(log):
+      module.run(csv_items, csv_shelves, output, output_format=output_format, report=output + '.report.json', backend=backend)
+    return (number, None, time.time() - start)
+  except Exception:
+    return (number, traceback.format_exc(), time.time() - start)
+
+def run_batch(parser, scenes, workers=None, output_format='json', backend='shapely'):
+  # Runs all scenes, reporting each as it finishes. Returns the failed scene numbers.
+  warm_shelf_cache(parser, scenes, backend)
+  tasks = [(parser, output_format, backend, number, scene) for number, scene in enumerate(scenes, 1)]
+  failed = []
+  start = time.time()
+  pool = multiprocessing.Pool(workers)
+  try:
+    for number, error, seconds in pool.imap_unordered(run_scene, tasks):
+      scene = scenes[number-1]
+      if error:
+        failed.append(number)
+        print('Scene ' + str(number) + ' (' + scene[0] + ') failed after ' + '%.2f' % seconds + ' s:\n' + error)
+      else:
+        print('Scene ' + str(number) + ' (' + scene[0] + ') written to ' + scene[2] + ' in ' + '%.2f' % seconds + ' s')
+  finally:
+    pool.close()
+    pool.join()
+  print(str(len(scenes) - len(failed)) + ' of ' + str(len(scenes)) + ' scenes done in ' + '%.2f' % (time.time() - start) + ' s')
+  if failed:
+    print('Failed scenes: ' + ', '.join(str(number) for number in sorted(failed)))
+  return sorted(failed)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('manifest', help='scenes, one items CSV|shelves CSV|output JSON per line')
+  parser.add_argument('--parser', choices=PARSERS, default='UnrealToERP', help='parser of the scenes')
+  parser.add_argument('--format', choices=OUTPUT_FORMATS, default='json', help='output format of the scenes')
+  parser.add_argument('--workers', type=int, default=0, help='scenes processed in parallel, 0 for all cores')
+  parser.add_argument('--backend', choices=GEOMETRY_BACKENDS, default='shapely', help='geometry backend of the shelf index')
+  args = parser.parse_args()
+  sys.exit(1 if run_batch(args.parser, read_manifest(args.manifest), args.workers or None, args.format, args.backend) else 0)
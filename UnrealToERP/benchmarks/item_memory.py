@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+# Memory used by the items of an export: one Item object per row (shapely
+# Point, Python floats, per-row name string) against the columnar ItemStore.
+# Every model is measured in a fresh interpreter so peak RSS is comparable.
+#
+#   python benchmarks/item_memory.py [csv_items] [--repeat N]
+
+import argparse
+import csv
+import os
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from shapely.geometry import Point
+from item_store import ItemStore
+
+class ObjectItem:
+  # Per-row item model as csv_to_products built it before the ItemStore
+  def __init__(self, data):
+    self.name = str(data[0])
+    self.position = Point(float(data[1]), float(data[2]))
+    self.height = float(data[3])
+    self.shelf = None
+    self.layer = None
+
+def read_rows(csv_items):
+  with open(csv_items, mode='r') as csv_file:
+    rows = [data for data in csv.reader(csv_file, delimiter='|') if data and data[0] != 'ModelName']
+  return rows
+
+def build_objects(rows, repeat):
+  items = []
+  for _ in range(repeat):
+    for data in rows:
+      items.append(ObjectItem(data))
+  return items
+
+def build_store(rows, repeat):
+  store = ItemStore()
+  products = {}
+  for _ in range(repeat):
+    for data in rows:
+      name = str(data[0])
+      if not name in products:
+        products[name] = store.add_product(name)
+      store.append(products[name], float(data[1]), float(data[2]), float(data[3]))
+  return store
+
+def peak_rss():
+  # ru_maxrss is in kilobytes on Linux
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def measure(model, csv_items, repeat):
+  rows = read_rows(csv_items)
+  rss_before = peak_rss()
+  tracemalloc.start()
+  items = (build_objects if model == 'objects' else build_store)(rows, repeat)
+  python_heap = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  rss = peak_rss() - rss_before
+  print(model + '|' + str(len(items)) + '|' + str(python_heap) + '|' + str(rss))
+
+def main():
+  parser = argparse.ArgumentParser(description='Compare item memory of the object model and the ItemStore')
+  parser.add_argument('csv_items', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'allitems.csv'))
+  parser.add_argument('--repeat', type=int, default=20, help='load the export this many times')
+  parser.add_argument('--model', choices=['objects', 'store'], help=argparse.SUPPRESS)
+  args = parser.parse_args()
+  if args.model:
+    measure(args.model, args.csv_items, args.repeat)
+    return
+  print('model     items     python heap   bytes/item   peak rss     bytes/item')
+  for model in ['objects', 'store']:
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), args.csv_items, '--repeat', str(args.repeat), '--model', model])
+    model, count, python_heap, rss = output.decode().strip().split('|')
+    count, python_heap, rss = int(count), int(python_heap), int(rss)
+    print('%-9s %-9d %-13d %-12.1f %-12d %.1f' % (model, count, python_heap, float(python_heap) / count, rss, float(rss) / count))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+# Time of every pipeline stage on synthetic stores of growing size, and the
+# peak RSS of the whole run. Every size runs in a fresh interpreter so peak
+# RSS is comparable; stage messages of the parser are discarded. With
+# --trace-memory every stage also gets the peak of the memory allocated
+# during it (tracemalloc, which includes numpy arrays), at the cost of
+# slower stages.
+#
+#   python benchmarks/pipeline_scaling.py --items 10000,100000,1000000 [--parser UnrealToERP_2] [--workers N] [--stages] [--trace-memory]
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic_store import generate_store
+import engine
+
+STAGES = ['csv_to_shelves', 'csv_to_products', 'fill', 'check_unlocated_products', 'calc_layers', 'calc_facings', 'calc_orders', 'calc_locations', 'write_output']
+
+def peak_rss():
+  # ru_maxrss is in kilobytes on Linux
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def stage_peak():
+  # Peak traced memory since the last call, None without --trace-memory
+  if not tracemalloc.is_tracing():
+    return None
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.reset_peak()
+  return peak
+
+def measure(parser, csv_items, csv_shelves, workers, stages=False, trace_memory=False):
+  # {stage: (seconds, peak traced memory of the stage or None)} and the peak rss of the run
+  module = importlib.import_module(parser)
+  results = {}
+  if trace_memory:
+    tracemalloc.start()
+  # Peaks of the stages in progress, so a nested stage (check_unlocated_products
+  # in fill) does not lose the peak of the stage around it
+  open_peaks = []
+  def timed(stage, function):
+    def run(*args, **kwargs):
+      peak = stage_peak()
+      if open_peaks and peak is not None:
+        open_peaks[-1] = max(open_peaks[-1], peak)
+      open_peaks.append(0)
+      start = time.time()
+      value = function(*args, **kwargs)
+      seconds = time.time() - start
+      peak = stage_peak()
+      if peak is not None:
+        peak = max(peak, open_peaks[-1])
+      open_peaks.pop()
+      if open_peaks and peak is not None:
+        open_peaks[-1] = max(open_peaks[-1], peak)
+      results[stage] = (seconds, peak)
+      return value
+    return run
+  # engine.fill calls check_unlocated_products through the engine module, so it is timed on its own
+  engine.check_unlocated_products = timed('check_unlocated_products', engine.check_unlocated_products)
+  output = os.path.join(os.path.dirname(csv_items), 'ERP.json')
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    shelves = timed('csv_to_shelves', module.csv_to_shelves)(csv_shelves)
+    products = timed('csv_to_products', module.csv_to_products)(csv_items)
+    timed('fill', module.fill)(products, shelves)
+    results['fill'] = (results['fill'][0] - results['check_unlocated_products'][0], results['fill'][1])
+    if stages:
+      timed('calc_layers', lambda: [product.calc_layers() for product in products])()
+      timed('calc_facings', lambda: [product.calc_facings() for product in products])()
+      timed('calc_orders', lambda: [shelf.calc_orders() for shelf in shelves])()
+    else:
+      timed('calc_locations', module.calc_locations)(products, workers)
+    timed('write_output', module.write_output)(products, output)
+  return {'items': len(products[0].store) if products else 0, 'shelves': len(shelves), 'stages': results, 'peak_rss': peak_rss()}
+
+def main():
+  parser = argparse.ArgumentParser(description='Time the pipeline stages on synthetic stores')
+  parser.add_argument('--items', default='10000,100000,1000000', help='comma separated item counts')
+  parser.add_argument('--items-per-shelf', type=int, default=2000, help='shelves are items / this')
+  parser.add_argument('--products', type=int, default=5000, help='number of distinct products')
+  parser.add_argument('--parser', choices=['UnrealToERP', 'UnrealToERP_2'], default='UnrealToERP')
+  parser.add_argument('--workers', type=int, default=1, help='processes of calc_locations, 0 for all cores')
+  parser.add_argument('--stages', action='store_true', help='run calc_layers, calc_facings and calc_orders as separate passes instead of calc_locations')
+  parser.add_argument('--trace-memory', action='store_true', help='also measure the peak memory allocated in every stage, slows the stages down')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--run', nargs=2, metavar=('CSV_ITEMS', 'CSV_SHELVES'), help=argparse.SUPPRESS)
+  args = parser.parse_args()
+  if args.run:
+    print(json.dumps(measure(args.parser, args.run[0], args.run[1], args.workers or None, args.stages, args.trace_memory)))
+    return
+  print('items      shelves  stage                      seconds     ' + ('stage peak MB' if args.trace_memory else ''))
+  for item_count in [int(count) for count in args.items.split(',')]:
+    directory = tempfile.mkdtemp(prefix='erp_bench_')
+    try:
+      csv_items, csv_shelves = generate_store(directory, max(1, item_count // args.items_per_shelf), item_count, args.products, seed=args.seed, item_header=args.parser == 'UnrealToERP')
+      output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--parser', args.parser, '--workers', str(args.workers)] + (['--stages'] if args.stages else []) + (['--trace-memory'] if args.trace_memory else []) + ['--run', csv_items, csv_shelves])
+      result = json.loads(output.decode().strip().splitlines()[-1])
+    finally:
+      shutil.rmtree(directory)
+    total = 0.0
+    for stage in STAGES:
+      if stage in result['stages']:
+        seconds, peak = result['stages'][stage]
+        total += seconds
+        print('%-10d %-8d %-26s %-11.3f %s' % (result['items'], result['shelves'], stage, seconds, '%.1f' % (peak / 1e6) if peak is not None else ''))
+    print('%-10d %-8d %-26s %-11.3f peak rss %.1f MB' % (result['items'], result['shelves'], 'total', total, result['peak_rss'] / 1e6))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+# Synthetic stores in the pipe-delimited Unreal export format, for benchmarks
+# at sizes the checked-in samples do not reach. The shelves are ShelfSystem W
+# and G types that both parsers know, rotated by multiples of 90 degrees on a
+# grid, each with a Bottom board and ShelfLayer boards. Every facing slot of a
+# layer holds one product, its items lie within a few millimetres of the slot
+# so they form one facing. A fraction of the items is placed in the aisles.
+#
+#   python benchmarks/synthetic_store.py out_dir --shelves 200 --items 1000000
+
+import argparse
+import math
+import os
+import numpy as np
+
+HEADER = 'ModelName|Postion.X|Postion.Y|Postion.Z|Rotation.W|Rotation.X|Rotation.Y|Rotation.Z|Movability|'
+
+# (type, depth, width) of the shelf types, as UnrealToERP.py reads them from the name
+SHELF_TYPES = [
+  ('H160T4L10W', 0.4, 1.0),
+  ('H160T6L10G', 0.6, 1.0),
+  ('H180T5L10W', 0.5, 1.0),
+  ('H200T5L6W', 0.5, 0.6),
+  ('H200T6L6W', 0.6, 0.6),
+  ('H200T6L10W', 0.6, 1.0),
+  ('H200T6L12W', 0.6, 1.2),
+  ('H200T7L10W', 0.7, 1.0)]
+
+CELL_SIZE = 2.0
+FACING_WIDTH = 0.1
+BOTTOM_HEIGHT = 0.13
+LAYER_HEIGHT = 0.3
+
+def rotation(yaw):
+  # Rotation columns whose angle is yaw for yaw_from_quaternion
+  return [math.sin(yaw / 2), 0.0, 0.0, math.cos(yaw / 2)]
+
+def transform(center, yaw, dx, dy):
+  return (center[0] + dx * math.cos(yaw) - dy * math.sin(yaw), center[1] + dx * math.sin(yaw) + dy * math.cos(yaw))
+
+def row(name, x, y, z, quaternion):
+  return name + '|' + '|'.join('%.6f' % value for value in [x, y, z] + quaternion) + '|2|'
+
+def generate_shelves(shelf_count, layers, random):
+  # Shelf rows and, per side of every shelf, (center, yaw, depth, width, board heights)
+  rows = [HEADER]
+  sides = []
+  columns = int(math.ceil(math.sqrt(shelf_count)))
+  for k in range(shelf_count):
+    shelf_type, depth, width = SHELF_TYPES[random.randint(len(SHELF_TYPES))]
+    yaw = random.randint(4) * math.pi / 2
+    center = ((k % columns) * CELL_SIZE, (k // columns) * CELL_SIZE)
+    rows.append(row('ShelfSystem' + shelf_type, center[0], center[1], 0.8, rotation(yaw)))
+    layer_count = random.randint(max(1, layers - 2), layers + 1)
+    heights = [BOTTOM_HEIGHT + i * LAYER_HEIGHT for i in range(layer_count)]
+    tiles = shelf_type[shelf_type.find('T')+1:shelf_type.find('L')]
+    length = shelf_type[shelf_type.find('L'):-1]
+    if shelf_type.endswith('G'):
+      side_centers = [transform(center, yaw, 0, depth / 2), transform(center, yaw, 0, -depth / 2)]
+    else:
+      side_centers = [center]
+    for side_center in side_centers:
+      rows.append(row('ShelfLayer' + tiles + 'Tiles' + length + '_Bottom', side_center[0], side_center[1], heights[0], rotation(yaw)))
+      for height in heights[1:]:
+        rows.append(row('ShelfLayer' + tiles + 'Tiles' + length, side_center[0], side_center[1], height, rotation(yaw)))
+      sides.append((side_center, yaw, depth, width, heights))
+  return (rows, sides)
+
+def generate_items(sides, item_count, product_count, unlocated, random):
+  # (names, x, y, z) of the items, placed in facing slots of random layers
+  slots = []
+  for side, (center, yaw, depth, width, heights) in enumerate(sides):
+    slot_count = max(1, int(width / FACING_WIDTH) - 1)
+    for layer, height in enumerate(heights):
+      for slot in range(slot_count):
+        slots.append((side, height, (slot + 1) * FACING_WIDTH - width / 2))
+  slots = np.array(slots, dtype=np.float64)
+  slot_products = random.randint(product_count, size=len(slots))
+  picked = random.randint(len(slots), size=item_count)
+  side = slots[picked, 0].astype(np.intp)
+  dx = slots[picked, 2] + random.uniform(-0.002, 0.002, item_count)
+  depths = np.array([s[2] for s in sides])
+  dy = random.uniform(-0.4, 0.4, item_count) * depths[side]
+  centers = np.array([s[0] for s in sides])
+  yaws = np.array([s[1] for s in sides])[side]
+  x = centers[side, 0] + dx * np.cos(yaws) - dy * np.sin(yaws)
+  y = centers[side, 1] + dx * np.sin(yaws) + dy * np.cos(yaws)
+  z = slots[picked, 1] + random.uniform(0.01, LAYER_HEIGHT - 0.05, item_count)
+  # Items in the aisles, between the grid cells
+  aisle = random.uniform(size=item_count) < unlocated
+  x[aisle] = np.floor(x[aisle] / CELL_SIZE) * CELL_SIZE + CELL_SIZE / 2
+  products = slot_products[picked]
+  return (products, x, y, z)
+
+def write_items(path, products, x, y, z, header=True, chunk_size=100000):
+  names = ['ProductWithAN%06d' % product for product in range(int(products.max()) + 1 if len(products) else 0)]
+  quaternion = rotation(0.0)
+  with open(path, 'w') as csv_file:
+    if header:
+      csv_file.write(HEADER + '\n')
+    for start in range(0, len(products), chunk_size):
+      end = start + chunk_size
+      csv_file.write('\n'.join(row(names[product], x_k, y_k, z_k, quaternion) for product, x_k, y_k, z_k in zip(products[start:end].tolist(), x[start:end].tolist(), y[start:end].tolist(), z[start:end].tolist())) + '\n')
+
+def generate_store(directory, shelves=100, items=100000, products=2000, layers=5, unlocated=0.01, seed=0, item_header=True):
+  # Writes shelves.csv and items.csv to directory and returns their paths.
+  # UnrealToERP_2.py reads the items without a header, use item_header=False for it.
+  random = np.random.RandomState(seed)
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  rows, sides = generate_shelves(shelves, layers, random)
+  csv_shelves = os.path.join(directory, 'shelves.csv')
+  with open(csv_shelves, 'w') as csv_file:
+    csv_file.write('\n'.join(rows) + '\n')
+  csv_items = os.path.join(directory, 'items.csv')
+  write_items(csv_items, *generate_items(sides, items, products, unlocated, random), header=item_header)
+  return (csv_items, csv_shelves)
+
+def main():
+  parser = argparse.ArgumentParser(description='Generate a synthetic store export')
+  parser.add_argument('directory', help='directory for shelves.csv and items.csv')
+  parser.add_argument('--shelves', type=int, default=100, help='number of ShelfSystem rows')
+  parser.add_argument('--items', type=int, default=100000, help='number of items')
+  parser.add_argument('--products', type=int, default=2000, help='number of distinct products')
+  parser.add_argument('--layers', type=int, default=5, help='typical number of boards per shelf')
+  parser.add_argument('--unlocated', type=float, default=0.01, help='fraction of items placed in the aisles')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--no-item-header', action='store_true', help='no header row in items.csv, as UnrealToERP_2.py expects')
+  args = parser.parse_args()
+  csv_items, csv_shelves = generate_store(args.directory, args.shelves, args.items, args.products, args.layers, args.unlocated, args.seed, not args.no_item_header)
+  print('Written ' + csv_shelves + ' and ' + csv_items)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+import argparse
+import bisect
+import json
+from output_writers import read_records
+
+# Planogram compliance: the locations computed from a scene against a
+# reference planogram with the same structure (records of product, shelf,
+# layer, Facing and Order, read from any output format and schema). Both
+# sides are joined on hashed (product, shelf, layer) keys in one pass:
+#   missing             in the reference only
+#   extra               in the scene only
+#   wrong_layer         on the right shelf but another layer
+#   wrong_facing_count  on the right layer with another number of facings
+#   out_of_order        on the right layer, but not in the reference order
+#                       relative to the other products found on that layer
+# Shelves and layers are compared as text, so 5 and '5' are the same.
+
+def location_key(record):
+  return (record['product'], str(record['shelf']), str(record['layer']))
+
+def ordered_subsequence(values):
+  # Positions of a longest non-decreasing subsequence of values
+  tails = []
+  tail_positions = []
+  previous = [-1] * len(values)
+  for position, value in enumerate(values):
+    k = bisect.bisect_right(tails, value)
+    if k == len(tails):
+      tails.append(value)
+      tail_positions.append(position)
+    else:
+      tails[k] = value
+      tail_positions[k] = position
+    previous[position] = tail_positions[k-1] if k else -1
+  kept = set()
+  position = tail_positions[-1] if tail_positions else -1
+  while position >= 0:
+    kept.add(position)
+    position = previous[position]
+  return kept
+
+def compare(reference, actual):
+  # Compliance report of the actual records against the reference records
+  expected = {}
+  for record in reference:
+    expected[location_key(record)] = record
+  report = {'missing': [], 'extra': [], 'wrong_layer': [], 'wrong_facing_count': [], 'out_of_order': []}
+  matched = {}
+  unmatched = {}
+  layers = {}
+  actual_count = 0
+  for record in actual:
+    actual_count += 1
+    key = location_key(record)
+    if not key in expected:
+      unmatched.setdefault(key[:2], []).append(record)
+      continue
+    matched[key] = True
+    reference_record = expected[key]
+    if reference_record.get('Facing') is not None and record.get('Facing') != reference_record['Facing']:
+      report['wrong_facing_count'].append({'product': key[0], 'shelf': record['shelf'], 'layer': record['layer'], 'expected': reference_record['Facing'], 'actual': record.get('Facing')})
+    if reference_record.get('Order') is not None and record.get('Order') is not None:
+      layers.setdefault(key[1:], []).append((record['Order'], key[0], reference_record['Order'], record))
+  # Locations of the reference not found: on another layer of the same shelf, or missing
+  for key in expected:
+    if not key in matched:
+      record = expected[key]
+      found = unmatched.get(key[:2])
+      if found:
+        other = found.pop(0)
+        report['wrong_layer'].append({'product': key[0], 'shelf': record['shelf'], 'expected_layer': record['layer'], 'layer': other['layer']})
+      else:
+        report['missing'].append(record)
+  for key in unmatched:
+    report['extra'].extend(unmatched[key])
+  # Products in the reference order are the longest subsequence with non-decreasing reference orders
+  for key in layers:
+    entries = sorted(layers[key], key=lambda entry: (entry[0], entry[1]))
+    kept = ordered_subsequence([entry[2] for entry in entries])
+    for position, (order, product, expected_order, record) in enumerate(entries):
+      if not position in kept:
+        report['out_of_order'].append({'product': product, 'shelf': record['shelf'], 'layer': record['layer'], 'expected_order': expected_order, 'order': order})
+  report['summary'] = {'reference': len(expected), 'actual': actual_count, 'matched': len(matched)}
+  for kind in ('missing', 'extra', 'wrong_layer', 'wrong_facing_count', 'out_of_order'):
+    report['summary'][kind] = len(report[kind])
+  return report
+
+def print_summary(report):
+  summary = report['summary']
+  print(str(summary['matched']) + ' of ' + str(summary['reference']) + ' planogram locations found, ' + str(summary['missing']) + ' missing, ' + str(summary['extra']) + ' extra, ' + str(summary['wrong_layer']) + ' on the wrong layer, ' + str(summary['wrong_facing_count']) + ' with a wrong facing count, ' + str(summary['out_of_order']) + ' out of order')
+
+def write_report(report, path):
+  with open(path, 'w') as outfile:
+    json.dump(report, outfile, indent=2)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Compare the locations computed from a scene with a reference planogram')
+  parser.add_argument('reference', help='reference planogram, in any output format')
+  parser.add_argument('actual', help='parser output of the scene, in any output format')
+  parser.add_argument('--report', help='write the full compliance report as JSON to this file')
+  args = parser.parse_args()
+  report = compare(read_records(args.reference), read_records(args.actual))
+  print_summary(report)
+  if args.report:
+    write_report(report, args.report)
@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+
+from array import array
+import argparse
+import csv
+import math
+import numpy as np
+from shapely.geometry.polygon import Polygon
+from shelf_index import ShelfIndex, GEOMETRY_BACKENDS, resolve_conflicts
+from facings import FACING_TOLERANCE, cluster_distances, calc_side_distances
+from item_store import ItemStore
+from quaternion import yaw_from_quaternion
+from shelf_table import ShelfTable, footprint_table, side_line_table
+from shelf_cache import cache_key, load_shelves
+from streaming import DEFAULT_CHUNK_SIZE, StreamAggregator, read_chunks
+from scene_format import Scene, is_scene
+import shelf_workers
+import incremental
+import output_writers
+import instrumentation
+import compliance
+
+# The parser shared by UnrealToERP.py and UnrealToERP_2.py. Where the two
+# differ, a ParserConfig decides. A run fills all items into shelves in one
+# pass over the item store and then computes layers, facings and orders in
+# one traversal per shelf (shelf_workers), instead of separate passes per
+# product and per shelf.
+
+# (type, depth, width) of the shelf types with hard-coded sizes
+SHELF_TYPES = [
+  ('H160T4L10W', 0.6, 1.0),
+  ('H160T6L10G', 1.2, 1.0),
+  ('H200T7L10W', 0.85, 1.0),
+  ('H180T5L10W', 0.6, 1.0),
+  ('H200T5L6W', 0.6, 0.7),
+  ('H200T6L10W', 0.7, 1.0),
+  ('H200T6L12W', 0.7, 1.25),
+  ('H200T6L6W', 0.7, 0.65)]
+
+class ParserConfig:
+  # layer_numbering: 'top-down' numbers the top layer 1, 'bottom-up' the bottom layer
+  # named_keys: shelf ids 'Shelf N' and layer keys 'Layer N' instead of plain numbers
+  # shelf_sizes: 'name' reads depth and width from the ShelfSystem name and
+  #   splits G (double sided) shelves in two, 'table' looks them up in SHELF_TYPES
+  # output_schema: 'locations' ({name: {'locations': [...]}}) or 'shelves'
+  #   ({name: {'Shelves': [{'id', 'Layers': [{'id', 'Facing', 'Order'}]}]}})
+  # skip_header: the items CSV starts with a header row
+  # first_wins: an item in several shelves stays in the first one, else the last one
+  def __init__(self, layer_numbering='top-down', named_keys=True, shelf_sizes='name', output_schema='locations', skip_header=True, first_wins=True):
+    self.layer_numbering = layer_numbering
+    self.named_keys = named_keys
+    self.shelf_sizes = shelf_sizes
+    self.output_schema = output_schema
+    self.skip_header = skip_header
+    self.first_wins = first_wins
+
+  def layer_key(self, layer):
+    return 'Layer ' + str(layer.num) if self.named_keys else layer.num
+
+  def shelf_id(self, number):
+    return 'Shelf ' + str(number) if self.named_keys else number
+
+  def shelf_label(self, shelf):
+    return shelf.id if self.named_keys else 'Shelf ' + str(shelf.id)
+
+UNREAL_TO_ERP = ParserConfig()
+UNREAL_TO_ERP_2 = ParserConfig(layer_numbering='bottom-up', named_keys=False, shelf_sizes='table', output_schema='shelves', skip_header=False, first_wins=False)
+
+class Product:
+  def __init__(self, name, store=None, config=UNREAL_TO_ERP):
+    self.name = name
+    self.store = store if store is not None else ItemStore()
+    self.config = config
+    self.index = self.store.add_product(name)
+    self.rows = array('i')
+    self.shelves = []
+    self.locations = {}
+
+  @property
+  def items(self):
+    return [self.store.item(row) for row in self.rows]
+
+  def add_item(self, x, y, z):
+    self.rows.append(self.store.append(self.index, x, y, z))
+
+  def column(self, name):
+    return self.store.column(name)[np.frombuffer(self.rows, dtype=np.intc)]
+
+  def calc_layers(self):
+    rows = np.frombuffer(self.rows, dtype=np.intc)
+    shelf_idx = self.store.column('shelf')[rows]
+    layer_idx = self.store.column('layer')
+    heights = self.store.column('z')
+    for i in np.unique(shelf_idx[shelf_idx >= 0]).tolist():
+      shelf_rows = rows[shelf_idx == i]
+      layer_idx[shelf_rows] = self.store.shelves[i].find_layers(heights[shelf_rows])
+    del layer_idx
+    for item in self.items:
+      if item.layer:
+        if not item.shelf.id in self.locations:
+          self.locations[item.shelf.id] = {}
+        if not self.config.layer_key(item.layer) in self.locations[item.shelf.id]:
+          self.locations[item.shelf.id][self.config.layer_key(item.layer)] = {}
+
+  def calc_facings(self, tolerance=FACING_TOLERANCE):
+    shelf_idx = self.column('shelf')
+    positions_by_layer = {}
+    for k, (i, j) in enumerate(zip(shelf_idx.tolist(), self.column('layer').tolist())):
+      if j >= 0:
+        positions_by_layer.setdefault((i, j), []).append(k)
+    if not positions_by_layer:
+      return
+    # Side distances of all items of the product at once, to the side line of their shelf
+    shelf_positions, shelf_idx = np.unique(np.maximum(shelf_idx, 0), return_inverse=True)
+    side_lines = side_line_table([self.store.shelves[i] for i in shelf_positions.tolist()])[shelf_idx]
+    side_distances = calc_side_distances(self.column('x'), self.column('y'), side_lines)
+    for i, j in positions_by_layer:
+      shelf = self.store.shelves[i]
+      layer = shelf.layers[j]
+      layer.orders[self] = cluster_distances(side_distances[positions_by_layer[(i, j)]], tolerance)
+      self.locations[shelf.id][self.config.layer_key(layer)] = {}
+      self.locations[shelf.id][self.config.layer_key(layer)]['Facing'] = len(layer.orders[self])
+
+  def __repr__(self):
+    return str(self.name)
+
+def transform2d(x_trans, y_trans, x_rot, y_rot, yaw):
+  c = math.cos(yaw)
+  s = math.sin(yaw)
+  x_res = x_rot * c + y_rot * s + x_trans
+  y_res = -x_rot * s + y_rot * c + y_trans
+  return (x_res, y_res)
+
+class Shelf:
+  # The geometry is row position of a ShelfTable shared by the shelves of a
+  # scene (csv_to_shelves), a shelf created on its own gets a table of one row
+  def __init__(self, data, shelf_id, depth, width, yaw=None, config=UNREAL_TO_ERP, table=None, position=0):
+    self.id = shelf_id
+    self.type = str(data[0])
+    self.depth = depth
+    self.width = width
+    self.config = config
+    if table is None:
+      if yaw is None:
+        yaw = yaw_from_quaternion((float(data[4]), float(data[5]), float(data[6]), float(data[7])))
+      table = ShelfTable([[float(data[1]), float(data[2])]], [yaw], [depth], [width])
+    self.table = table
+    self.position = position
+    self.center = table.centers[position].tolist()
+    self.yaw = float(table.yaw[position])
+    self.shape = None
+    self.layers = []
+    self.layer_bounds = np.zeros(0)
+    self.products = []
+
+  @property
+  def corners(self):
+    return self.table.corners[self.position]
+
+  @property
+  def side_line(self):
+    # Unit normal and offset of the side line through p2 and p3
+    return self.table.side_lines[self.position]
+
+  @property
+  def bounds(self):
+    return self.table.bounds(self.position)
+
+  @property
+  def polygon(self):
+    if self.shape is None:
+      self.shape = Polygon(self.corners.tolist())
+    return self.shape
+
+  def set_layers(self, heights):
+    # Layer i spans from the i-th to the (i+1)-th sorted board height
+    heights = sorted(heights)
+    self.layer_bounds = np.array(heights, dtype=np.float64)
+    for i in range(len(heights)):
+      z_max = heights[i+1] if i+1 < len(heights) else float('inf')
+      num = len(heights)-i if self.config.layer_numbering == 'top-down' else i+1
+      self.layers.append(Layer(num, heights[i], z_max))
+
+  def find_layers(self, heights):
+    # Index into self.layers of the top-most layer holding each height, -1 below the bottom board
+    return np.searchsorted(self.layer_bounds, heights, side='right') - 1
+
+  def calc_orders(self):
+    for layer in self.layers:
+      for product in layer.orders:
+        for facing in layer.orders[product]:
+          layer.orders_sorted.append((product, facing[0]))
+      layer.orders_sorted.sort(key=lambda x: x[1])
+      for i, order_sorted in enumerate(layer.orders_sorted):
+        if self.config.layer_key(layer) in order_sorted[0].locations[self.id]:
+          order_sorted[0].locations[self.id][self.config.layer_key(layer)]['Order'] = i+1
+
+  def __repr__(self):
+    return str(self.id) + ' - ' + str(self.center) + ' - ' + self.type + ' - ' + str(self.polygon)
+
+class Layer:
+  def __init__(self, num, z_min, z_max):
+    self.num = num
+    self.z_min = z_min
+    self.z_max = z_max
+    self.orders = {}
+    self.orders_sorted = []
+  def __repr__(self):
+    return 'Layer ' + str(self.num) + ' - ' + str([self.z_min, self.z_max])
+
+def fill(products, shelves, config=UNREAL_TO_ERP, index=None, backend='shapely', fix_unlocated=False, max_distance=float('inf')):
+  # Locates the items of all products in one pass over their item store;
+  # unlocated items are reported with their nearest shelf within max_distance
+  if index is None:
+    index = ShelfIndex(shelves, backend=backend)
+  stores = {}
+  for product in products:
+    stores[id(product.store)] = product.store
+  located = {}
+  for store in stores.values():
+    located[id(store)] = index.locate(store.column('x'), store.column('y'))
+  for product in products:
+    store = product.store
+    rows = product.rows
+    item_shelves = [located[id(store)][row] for row in rows]
+    product_shelves = {}
+    for row, shelf, candidates in zip(rows, resolve_conflicts(item_shelves, lambda k: str(store.item(rows[k])), config.first_wins), item_shelves):
+      if shelf:
+        store.set_shelf(row, shelf)
+      # With the last shelf winning, the item was on all its shelves in turn
+      for candidate in (candidates if not config.first_wins else [shelf] if shelf else []):
+        product_shelves[candidate] = True
+    for shelf in product_shelves:
+      if not product in shelf.products:
+        shelf.products.append(product)
+      if not shelf in product.shelves:
+        product.shelves.append(shelf)
+    index.sort_shelves(product.shelves)
+  with instrumentation.stage('unlocated search'):
+    check_unlocated_products(products, shelves, fix_unlocated, max_distance, index)
+
+def check_unlocated_products(products, shelves, fix_unlocated=False, max_distance=float('inf'), index=None):
+  if index is None:
+    index = ShelfIndex(shelves)
+  unlocated = [(product, item) for product in products for item in product.items if not item.shelf]
+  moved = index.nearest_shelves([item.position.x for product, item in unlocated], [item.position.y for product, item in unlocated], lambda k: str(unlocated[k][1]), fix_unlocated, max_distance)
+  for (product, item), nearest_shelf in zip(unlocated, moved):
+    if nearest_shelf:
+      item.shelf = nearest_shelf
+      if not product in nearest_shelf.products:
+        nearest_shelf.products.append(product)
+      if not nearest_shelf in product.shelves:
+        product.shelves.append(nearest_shelf)
+
+def csv_to_products(csv_items, config=UNREAL_TO_ERP):
+  if is_scene(csv_items):
+    return scene_to_products(Scene(csv_items), config)
+  store = ItemStore()
+  products = []
+  products_by_name = {}
+  with open(csv_items, mode='r') as csv_file:
+    csv_reader = csv.reader(csv_file, delimiter='|')
+    if config.skip_header:
+      next(csv_reader)
+    for data in csv_reader:
+      name = str(data[0])
+      if not name in products_by_name:
+        products_by_name[name] = Product(name, store, config)
+        products.append(products_by_name[name])
+      products_by_name[name].add_item(float(data[1]), float(data[2]), float(data[3]))
+  return products
+
+def scene_to_products(scene, config=UNREAL_TO_ERP):
+  # Same products as csv_to_products, with the item columns copied in bulk
+  # from the memory-mapped scene instead of parsed per row
+  store = ItemStore()
+  codes = np.asarray(scene.name)
+  used, first_rows = np.unique(codes, return_index=True)
+  product_of_code = np.full(len(scene.names), -1, dtype=np.intc)
+  products = []
+  for code in used[np.argsort(first_rows)].tolist():
+    products.append(Product(scene.names[code], store, config))
+    product_of_code[code] = products[-1].index
+  item_products = product_of_code[codes]
+  first_row = store.extend(item_products, scene.x, scene.y, scene.z)
+  rows = np.argsort(item_products, kind='stable')
+  bounds = np.flatnonzero(np.diff(item_products[rows])) + 1
+  for product, product_rows in zip(products, np.split(rows + first_row, bounds) if len(rows) else []):
+    product.rows.frombytes(memoryview(product_rows.astype(np.intc)).cast('B'))
+  return products
+
+def stream_products(csv_items, shelves, index, config=UNREAL_TO_ERP, chunk_size=DEFAULT_CHUNK_SIZE, fix_unlocated=False, max_distance=float('inf'), tolerance=FACING_TOLERANCE):
+  # Same products as csv_to_products, fill, calc_layers and calc_facings, reading the items in chunks
+  aggregator = StreamAggregator(shelves, index, lambda name, store: Product(name, store, config), config.layer_key, config.first_wins, fix_unlocated, max_distance, tolerance)
+  for names, xs, ys, zs in read_chunks(csv_items, chunk_size, skip_header=config.skip_header):
+    aggregator.add_chunk(names, xs, ys, zs)
+  return aggregator.finish()
+
+def calc_locations(products, config=UNREAL_TO_ERP, workers=None, tolerance=FACING_TOLERANCE):
+  # Same as calc_layers and calc_facings of every product and calc_orders of
+  # every shelf, computed in one traversal per shelf, on a process pool of
+  # workers processes unless workers is 1
+  return shelf_workers.calc_locations(products, config.layer_key, workers, tolerance)
+
+def update_locations(products, shelves, index, state_path, model_key, config=UNREAL_TO_ERP, workers=1, tolerance=FACING_TOLERANCE, fix_unlocated=False, max_distance=float('inf')):
+  # fill and calc_locations for a new export of the items, recomputing only the shelves
+  # whose items changed since the run saved in state_path, then saving this run there
+  state = incremental.load_state(state_path, model_key, tolerance)
+  if state:
+    results, changes = incremental.update_from_state(products, shelves, index, state, config.layer_key, config.first_wins, workers, tolerance, fix_unlocated, max_distance)
+    for change in changes:
+      instrumentation.count('incremental ' + change, changes[change])
+    instrumentation.event('incremental update', str(changes['added']) + ' items added, ' + str(changes['removed']) + ' removed and ' + str(changes['moved']) + ' moved, ' + str(changes['shelves']) + ' shelves recomputed')
+  else:
+    fill(products, shelves, config, index, fix_unlocated=fix_unlocated, max_distance=max_distance)
+    results = calc_locations(products, config, workers, tolerance)
+  incremental.save_state(state_path, products, shelves, results, model_key, tolerance)
+
+def shelf_footprints(data, config=UNREAL_TO_ERP):
+  # (depth, width, side) of the shelves of a ShelfSystem row, none for an
+  # unknown type; a gondola is split into its front (side 1) and back (side -1)
+  shelf_name = str(data[0])
+  if config.shelf_sizes == 'table':
+    for shelf_type, depth, width in SHELF_TYPES:
+      if shelf_type in shelf_name:
+        return [(depth, width, 0)]
+    return []
+  # height = float(shelf_name[shelf_name.find('H')+1:shelf_name.find('T')])/10
+  depth = float(shelf_name[shelf_name.find('T')+1:shelf_name.find('L')])/10 + 0.01
+  if 'W' in shelf_name:
+    length = float(shelf_name[shelf_name.find('L')+1:shelf_name.find('W')])/10 + 0.01
+    return [(depth, length, 0)]
+  elif 'G' in shelf_name:
+    length = float(shelf_name[shelf_name.find('L')+1:shelf_name.find('G')])/10 + 0.01
+    return [(depth, length, 1), (depth, length, -1)]
+  return []
+
+def csv_to_shelves(csv_shelves, config=UNREAL_TO_ERP, backend='shapely', with_index=False):
+  # With with_index, (shelves, index) with the ShelfIndex the boards were
+  # matched through, which then also locates the items
+  if is_scene(csv_shelves):
+    rows = list(Scene(csv_shelves).rows_as_csv())
+  else:
+    with open(csv_shelves, mode='r') as csv_file:
+      rows = list(csv.reader(csv_file, delimiter='|'))
+  shelf_rows = []
+  shelf_bottoms = []
+  shelf_layers = []
+  for data in rows:
+    if 'ShelfSystem' in str(data[0]):
+      shelf_rows.append(data)
+    elif 'Bottom' in str(data[0]):
+      shelf_bottoms.append(data)
+    elif 'ShelfLayer' in str(data[0]):
+      shelf_layers.append(data)
+  # The footprints of all shelves are built into one table in a single pass
+  footprints = []
+  shelf_ids = []
+  shelf_id = 0
+  for k, data in enumerate(shelf_rows):
+    row_footprints = shelf_footprints(data, config)
+    if not row_footprints:
+      instrumentation.event('invalid shelf', 'Invalid shelf: ' + str(data[0]))
+      shelf_id += 1
+    for depth, width, side in row_footprints:
+      shelf_id += 1
+      footprints.append((k, depth, width, side))
+      shelf_ids.append(shelf_id)
+  table = footprint_table(shelf_rows, footprints)
+  shelves = []
+  layer_heights = {}
+  for position, (k, depth, width, side) in enumerate(footprints):
+    shelves.append(Shelf(shelf_rows[k], config.shelf_id(shelf_ids[position]), depth, width, config=config, table=table, position=position))
+    layer_heights[shelves[-1]] = []
+  index = ShelfIndex(shelves, backend=backend)
+  boards = shelf_bottoms + shelf_layers
+  located = index.locate([float(data[1]) for data in boards], [float(data[2]) for data in boards])
+  for data, bottom_shelves in zip(shelf_bottoms, located[:len(shelf_bottoms)]):
+    for shelf in bottom_shelves:
+      layer_heights[shelf].append(float(data[3]))
+  for shelf in shelves:
+    if not layer_heights[shelf]:
+      instrumentation.event('missing bottom layer', config.shelf_label(shelf) + ', type ' + shelf.type + ' does not have bottom layer, its bottom height will be set to 0.0')
+      layer_heights[shelf].append(0.0)
+  for data, layer_shelves in zip(shelf_layers, located[len(shelf_bottoms):]):
+    for shelf in layer_shelves:
+      layer_heights[shelf].append(float(data[3]))
+  for shelf in layer_heights:
+    shelf.set_layers(layer_heights[shelf])
+  for shelf in shelves:
+    instrumentation.event('shelf created', config.shelf_label(shelf) + ', type ' + shelf.type + ', located at ' + str(shelf.center) + ', width ' + str(shelf.width) + ', depth ' + str(shelf.depth) + ' and has ' + str(len(shelf.layers)) + ' layers is created')
+  if with_index:
+    return (shelves, index)
+  return shelves
+
+def product_output(product, config=UNREAL_TO_ERP):
+  if config.output_schema == 'locations':
+    return {'locations': [product.locations]}
+  data = {}
+  data['Shelves'] = []
+  for location in product.locations:
+    data['Shelves'].append({})
+    data['Shelves'][-1]['id'] = location
+    data['Shelves'][-1]['Layers'] = []
+    for layer in product.locations[location]:
+      data['Shelves'][-1]['Layers'].append({})
+      data['Shelves'][-1]['Layers'][-1]['id'] = layer
+      data['Shelves'][-1]['Layers'][-1]['Facing'] = product.locations[location][layer]['Facing']
+      data['Shelves'][-1]['Layers'][-1]['Order'] = product.locations[location][layer]['Order']
+  return data
+
+def write_output(products, config=UNREAL_TO_ERP, output='output/ERP.json', output_format='json'):
+  output_writers.write(products, lambda product: product_output(product, config), output, output_format)
+
+def run(csv_items, csv_shelves, config, build, output='output/ERP.json', stream=False, workers=1, state=None, output_format='json', report=None, event_limit=instrumentation.DEFAULT_EVENT_LIMIT, profile_dir=None, compare=None, compare_report=None, backend='shapely', max_distance=float('inf'), fix_unlocated=False):
+  # build is the csv_to_shelves of the calling parser, so the shelf model
+  # cache keeps the models of the parsers apart. backend is the geometry
+  # backend of the shelf index. With compare, the locations
+  # are checked against that reference planogram. Returns the run report,
+  # also written to report if given.
+  instrumentation.start_run(event_limit, profile_dir)
+  with instrumentation.stage('shelves'):
+    shelves, index = load_shelves(csv_shelves, build, backend)
+  instrumentation.count('shelves', len(shelves))
+  if stream and state:
+    print('--state needs all items in memory, --stream is ignored')
+    stream = False
+  if stream:
+    with instrumentation.stage('stream items'):
+      products = stream_products(csv_items, shelves, index, config, fix_unlocated=fix_unlocated, max_distance=max_distance)
+  else:
+    with instrumentation.stage('parse items'):
+      products = csv_to_products(csv_items, config)
+  instrumentation.count('products', len(products))
+  if state:
+    with instrumentation.stage('incremental update'):
+      update_locations(products, shelves, index, state, cache_key(csv_shelves, build, backend), config, workers, fix_unlocated=fix_unlocated, max_distance=max_distance)
+  elif stream:
+    with instrumentation.stage('orders'):
+      for shelf in shelves:
+        shelf.calc_orders()
+  else:
+    with instrumentation.stage('fill'):
+      fill(products, shelves, config, index, fix_unlocated=fix_unlocated, max_distance=max_distance)
+    with instrumentation.stage('locations'):
+      calc_locations(products, config, workers)
+  with instrumentation.stage('write'):
+    write_output(products, config, output, output_format)
+  if compare:
+    with instrumentation.stage('compare'):
+      compliance_report = compliance.compare(output_writers.read_records(compare), [record for product in products for record in output_writers.location_records(product)])
+    compliance.print_summary(compliance_report)
+    if compare_report:
+      compliance.write_report(compliance_report, compare_report)
+  return instrumentation.finish_run(report)
+
+def main(run, csv_items, csv_shelves):
+  # Command line of a parser whose run(csv_items, csv_shelves, ...) wraps
+  # engine.run, with csv_items and csv_shelves as default inputs
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--items', default=csv_items, help='items CSV exported from Unreal')
+  parser.add_argument('--shelves', default=csv_shelves, help='shelves CSV exported from Unreal')
+  parser.add_argument('--output', default='output/ERP.json', help='ERP JSON to write')
+  parser.add_argument('--format', choices=output_writers.OUTPUT_FORMATS, default='json', help='output format')
+  parser.add_argument('--stream', action='store_true', help='read the items in chunks in bounded memory')
+  parser.add_argument('--workers', type=int, default=1, help='compute layers, facings and orders per shelf on this many processes, 0 for all cores')
+  parser.add_argument('--report', help='write the run report as JSON to this file')
+  parser.add_argument('--event-limit', type=int, default=instrumentation.DEFAULT_EVENT_LIMIT, help='messages printed per kind before they are only counted, negative for no limit')
+  parser.add_argument('--profile', metavar='DIR', help='profile every stage and dump the profiles to DIR')
+  parser.add_argument('--state', help='state file of the previous run, only shelves whose items changed are recomputed')
+  parser.add_argument('--compare', metavar='REFERENCE', help='check the locations against this reference planogram, in any output format')
+  parser.add_argument('--compare-report', help='write the full compliance report as JSON to this file')
+  parser.add_argument('--backend', choices=GEOMETRY_BACKENDS, default='shapely', help='geometry backend of the shelf index')
+  parser.add_argument('--max-distance', type=float, default=float('inf'), help='report unlocated items only with a nearest shelf within this distance')
+  args = parser.parse_args()
+  run(args.items, args.shelves, args.output, args.stream, args.workers or None, args.state, args.format, args.report, args.event_limit if args.event_limit >= 0 else None, args.profile, args.compare, args.compare_report, args.backend, args.max_distance)
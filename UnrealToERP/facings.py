@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+# Items of one product on one shelf layer whose side distances are closer
+# than this belong to the same facing
+FACING_TOLERANCE = 0.02
+
+def cluster_distances(distances, tolerance=FACING_TOLERANCE):
+  # Sort-and-sweep 1-D clustering: a new facing starts wherever the gap to the
+  # previous sorted distance is at least the tolerance. Returns one
+  # (min_distance, max_distance, item_count) tuple per facing, sorted.
+  distances = np.sort(np.asarray(distances, dtype=np.float64))
+  if not len(distances):
+    return []
+  starts = np.concatenate(([0], np.flatnonzero(np.diff(distances) >= tolerance) + 1))
+  ends = np.concatenate((starts[1:], [len(distances)]))
+  distances = distances.tolist()
+  return [(distances[start], distances[end-1], end - start) for start, end in zip(starts.tolist(), ends.tolist())]
+
+def merge_clusters(clusters, other_clusters, tolerance=FACING_TOLERANCE):
+  # Clusters of the union of two sets of distances, from the clusters of each
+  # set. Since every distance lies inside its cluster, the gap between two
+  # clusters that do not overlap is exactly the gap between sorted distances,
+  # so this gives the same result as clustering all distances at once.
+  merged = []
+  for cluster in sorted(clusters + other_clusters):
+    if merged and cluster[0] - merged[-1][1] < tolerance:
+      merged[-1] = (merged[-1][0], max(merged[-1][1], cluster[1]), merged[-1][2] + cluster[2])
+    else:
+      merged.append(cluster)
+  return merged
+
+def calc_side_distances(xs, ys, side_lines):
+  # Distances of the points to a side line (unit normal x, y and offset), or
+  # to one side line per point for an (n, 3) array of them
+  side_lines = np.asarray(side_lines, dtype=np.float64)
+  return np.abs(side_lines[..., 0] * xs + side_lines[..., 1] * ys - side_lines[..., 2])
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+import os
+import pickle
+import numpy as np
+from facings import FACING_TOLERANCE
+from item_store import ItemStore
+from shelf_cache import save
+from shelf_index import resolve_conflicts
+from shelf_workers import shelf_tasks, run_tasks, set_layers, merge_results
+import instrumentation
+
+# Incremental runs: the items of the previous run, their shelves and layers
+# and the per shelf results of shelf_workers are saved as a state file. A new
+# export is joined with the saved items, only the added items are located and
+# only the shelves that gained or lost items are recomputed. All other shelves
+# reuse their saved facings and orders.
+
+STATE_VERSION = 1
+
+def save_state(path, products, shelves, results, model_key, tolerance=FACING_TOLERANCE):
+  # An export without items saves a state without items
+  store = products[0].store if products else ItemStore()
+  positions = {}
+  for i, shelf in enumerate(shelves):
+    positions[shelf] = i
+  names = store.product_names
+  model_positions = np.array([positions[shelf] for shelf in store.shelves] + [-1], dtype=np.intc)
+  shelf_results = {}
+  for shelf_position, layers, locations, orders_sorted in results:
+    shelf_results[positions[store.shelves[shelf_position]]] = (
+      [(layer, names[product], clusters, order) for layer, product, first_row, clusters, order in locations],
+      dict((layer, [(names[product], distance) for product, distance in orders_sorted[layer]]) for layer in orders_sorted))
+  state = {
+    'version': STATE_VERSION,
+    'model_key': model_key,
+    'tolerance': tolerance,
+    'product_names': list(names),
+    'product': store.column('product').copy(),
+    'x': store.column('x').copy(),
+    'y': store.column('y').copy(),
+    'z': store.column('z').copy(),
+    'shelf': model_positions[store.column('shelf')],
+    'layer': store.column('layer').copy(),
+    'results': shelf_results}
+  save(state, path)
+
+def load_state(path, model_key, tolerance=FACING_TOLERANCE):
+  # Saved state, or None if there is none usable for this shelf model and tolerance
+  if not os.path.exists(path):
+    return None
+  try:
+    with open(path, mode='rb') as state_file:
+      state = pickle.load(state_file)
+  except Exception as e:
+    instrumentation.event('unusable state', 'State ' + path + ' could not be loaded, computing all shelves: ' + str(e))
+    return None
+  if state.get('version') != STATE_VERSION or state.get('model_key') != model_key or state.get('tolerance') != tolerance:
+    instrumentation.event('unusable state', 'State ' + path + ' was saved for another shelf model or tolerance, computing all shelves')
+    return None
+  return state
+
+def row_keys(products, xs, ys, zs):
+  # One hashable key per item: product code, exact coordinates and the
+  # number of identical items before it, so duplicates are matched in order
+  keys = np.stack((products.astype(np.int64), xs.view(np.int64), ys.view(np.int64), zs.view(np.int64)), axis=1)
+  order = np.lexsort(keys.T[::-1])
+  sorted_keys = keys[order]
+  group_start = np.ones(len(keys), dtype=bool)
+  group_start[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+  positions = np.arange(len(keys))
+  rank = np.empty(len(keys), dtype=np.int64)
+  rank[order] = positions - np.maximum.accumulate(np.where(group_start, positions, 0))
+  keys = np.ascontiguousarray(np.concatenate((keys, rank[:, None]), axis=1))
+  return keys.view(np.dtype((np.void, keys.dtype.itemsize * 5))).ravel()
+
+def diff_items(state, store):
+  # Rows kept from the saved run (saved row, new row), removed saved rows,
+  # added new rows and the number of added items that are moved saved items
+  codes = {}
+  saved_products = np.array([codes.setdefault(name, len(codes)) for name in state['product_names']] + [0], dtype=np.int64)[state['product']]
+  products = np.array([codes.setdefault(name, len(codes)) for name in store.product_names] + [0], dtype=np.int64)[store.column('product')]
+  saved_keys = row_keys(saved_products, state['x'], state['y'], state['z'])
+  keys = row_keys(products, store.column('x'), store.column('y'), store.column('z'))
+  common, saved_rows, rows = np.intersect1d(saved_keys, keys, assume_unique=True, return_indices=True)
+  removed = np.setdiff1d(np.arange(len(saved_keys)), saved_rows)
+  added = np.setdiff1d(np.arange(len(keys)), rows)
+  moved = np.minimum(np.bincount(saved_products[removed], minlength=len(codes)), np.bincount(products[added], minlength=len(codes))).sum()
+  return (saved_rows, rows, removed, added, int(moved))
+
+def locate_items(store, index, rows, first_wins=True, fix_unlocated=False, max_distance=float('inf')):
+  # fill() and check_unlocated_products() for the given rows only
+  x = store.column('x')
+  y = store.column('y')
+  rows = rows.tolist()
+  for row, shelf in zip(rows, resolve_conflicts(index.locate(x[rows], y[rows]), lambda k: str(store.item(rows[k])), first_wins)):
+    if shelf:
+      store.set_shelf(row, shelf)
+  unlocated = [row for row in rows if store.shelf[row] < 0]
+  for row, nearest_shelf in zip(unlocated, index.nearest_shelves(x[unlocated], y[unlocated], lambda k: str(store.item(unlocated[k])), fix_unlocated, max_distance)):
+    if nearest_shelf:
+      store.set_shelf(row, nearest_shelf)
+
+def link_products(products, shelves, store):
+  # product.shelves and shelf.products from the shelf column, as fill() sets them
+  shelf_column = store.column('shelf').astype(np.int64)
+  located = shelf_column >= 0
+  pairs = np.unique(store.column('product')[located].astype(np.int64) * len(shelves) + shelf_column[located])
+  products_by_index = {}
+  for product in products:
+    products_by_index[product.index] = product
+  for pair in pairs.tolist():
+    product = products_by_index[pair // len(shelves)]
+    shelf = shelves[pair % len(shelves)]
+    product.shelves.append(shelf)
+    shelf.products.append(product)
+
+def update_from_state(products, shelves, index, state, layer_key, first_wins=True, workers=1, tolerance=FACING_TOLERANCE, fix_unlocated=False, max_distance=float('inf')):
+  # Locations of the products of a new export (from csv_to_products, not
+  # filled yet) using the saved state. Returns the per shelf results and the
+  # counts of added, removed and moved items and of recomputed shelves.
+  if not products:
+    return ([], {'added': 0, 'removed': len(state['product']), 'moved': 0, 'shelves': 0})
+  store = products[0].store
+  for shelf in shelves:
+    store.shelf_position(shelf)
+  saved_rows, rows, removed, added, moved = diff_items(state, store)
+  shelf_column = store.column('shelf')
+  layer_column = store.column('layer')
+  shelf_column[rows] = state['shelf'][saved_rows]
+  layer_column[rows] = state['layer'][saved_rows]
+  del shelf_column, layer_column
+  locate_items(store, index, added, first_wins, fix_unlocated, max_distance)
+  link_products(products, shelves, store)
+  affected = set(state['shelf'][removed].tolist()) | set(store.column('shelf')[added].tolist())
+  affected.discard(-1)
+  tasks = shelf_tasks(store, tolerance, affected)
+  results = run_tasks(tasks, workers)
+  set_layers(store, tasks, results)
+  results += saved_results(store, state, affected)
+  merge_results(products, results, layer_key)
+  changes = {'added': len(added) - moved, 'removed': len(removed) - moved, 'moved': moved, 'shelves': len(tasks)}
+  return (results, changes)
+
+def saved_results(store, state, affected):
+  # Saved results of the shelves that did not change, with product indices
+  # and first rows of the new export
+  product_indices = {}
+  for i, name in enumerate(store.product_names):
+    product_indices[name] = i
+  shelf_column = store.column('shelf').astype(np.int64)
+  layer_column = store.column('layer').astype(np.int64)
+  product_column = store.column('product').astype(np.int64)
+  rows = np.flatnonzero((layer_column >= 0) & ~np.isin(shelf_column, list(affected)))
+  rows = rows[np.lexsort((rows, product_column[rows], layer_column[rows], shelf_column[rows]))]
+  keys = np.stack((shelf_column[rows], layer_column[rows], product_column[rows]), axis=1)
+  starts = np.concatenate(([0], np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1)) if len(rows) else np.zeros(0, dtype=np.intp)
+  first_rows = {}
+  for key, row in zip(keys[starts].tolist(), rows[starts].tolist()):
+    first_rows[tuple(key)] = row
+  results = []
+  for shelf_position in state['results']:
+    if not shelf_position in affected:
+      locations, orders_sorted = state['results'][shelf_position]
+      locations = [[layer, product_indices[name], first_rows[(shelf_position, layer, product_indices[name])], clusters, order] for layer, name, clusters, order in locations]
+      orders_sorted = dict((layer, [(product_indices[name], distance) for name, distance in orders_sorted[layer]]) for layer in orders_sorted)
+      results.append((shelf_position, None, locations, orders_sorted))
+  return results
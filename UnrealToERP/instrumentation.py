@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+import contextlib
+import cProfile
+import json
+import os
+import time
+
+# Run report of the parser: wall time per stage, counters and the number of
+# messages per kind. Messages are printed up to event_limit per kind and only
+# counted after that, so large exports do not flood the console. With a
+# profile_dir every top-level stage is profiled and dumped there as
+# <stage>.prof, readable with pstats.
+
+DEFAULT_EVENT_LIMIT = 20
+
+class Run:
+  def __init__(self, event_limit=DEFAULT_EVENT_LIMIT, profile_dir=None):
+    self.event_limit = event_limit
+    self.profile_dir = profile_dir
+    self.start = time.time()
+    self.stages = {}
+    self.counts = {}
+    self.events = {}
+    self.profiles = {}
+    self.stack = []
+
+  @contextlib.contextmanager
+  def stage(self, name):
+    # Time spent in nested stages is only counted for the nested stage
+    if not name in self.stages:
+      self.stages[name] = [0.0, 0]
+    profile = None
+    if self.profile_dir and not self.stack:
+      profile = self.profiles.setdefault(name, cProfile.Profile())
+      profile.enable()
+    self.stack.append(0.0)
+    start = time.time()
+    try:
+      yield
+    finally:
+      seconds = time.time() - start
+      nested = self.stack.pop()
+      if profile:
+        profile.disable()
+      self.stages[name][0] += seconds - nested
+      self.stages[name][1] += 1
+      if self.stack:
+        self.stack[-1] += seconds
+
+  def count(self, name, n=1):
+    self.counts[name] = self.counts.get(name, 0) + n
+
+  def event(self, kind, message):
+    self.events[kind] = self.events.get(kind, 0) + 1
+    if self.event_limit is None or self.events[kind] <= self.event_limit:
+      print(message)
+      if self.events[kind] == self.event_limit:
+        print('Further ' + kind + ' messages are only counted')
+
+  def report(self):
+    report = {
+      'seconds': time.time() - self.start,
+      'stages': [{'name': name, 'seconds': self.stages[name][0], 'calls': self.stages[name][1]} for name in self.stages],
+      'counts': dict(self.counts),
+      'events': dict(self.events)}
+    if self.profile_dir:
+      report['profiles'] = {}
+      for name in self.profiles:
+        report['profiles'][name] = os.path.join(self.profile_dir, name.replace(' ', '_') + '.prof')
+    return report
+
+  def finish(self):
+    # Prints the suppressed message counts, dumps the profiles and returns the report
+    for kind in self.events:
+      if self.event_limit is not None and self.events[kind] > self.event_limit:
+        print(str(self.events[kind]) + ' ' + kind + ' messages in total')
+    report = self.report()
+    if self.profile_dir:
+      if not os.path.isdir(self.profile_dir):
+        os.makedirs(self.profile_dir)
+      for name in self.profiles:
+        self.profiles[name].dump_stats(report['profiles'][name])
+    return report
+
+current = Run()
+
+def start_run(event_limit=DEFAULT_EVENT_LIMIT, profile_dir=None):
+  global current
+  current = Run(event_limit, profile_dir)
+  return current
+
+def stage(name):
+  return current.stage(name)
+
+def count(name, n=1):
+  current.count(name, n)
+
+def event(kind, message):
+  current.event(kind, message)
+
+def finish_run(report_path=None):
+  report = current.finish()
+  if report_path:
+    with open(report_path, 'w') as outfile:
+      json.dump(report, outfile, indent=2)
+  return report
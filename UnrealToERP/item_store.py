@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+from array import array
+import numpy as np
+from shapely.geometry import Point
+
+class ItemStore:
+  # Columnar storage of all items of a scene. Every item is a row in a set
+  # of typed arrays; shelves and layers are stored as indices (-1 = none)
+  # into self.shelves and into the layers of the item's shelf.
+  def __init__(self):
+    self.x = array('d')
+    self.y = array('d')
+    self.z = array('d')
+    self.product = array('i')
+    self.shelf = array('i')
+    self.layer = array('i')
+    self.product_names = []
+    self.shelves = []
+    self.shelf_positions = {}
+
+  def __len__(self):
+    return len(self.x)
+
+  def add_product(self, name):
+    self.product_names.append(name)
+    return len(self.product_names) - 1
+
+  def append(self, product, x, y, z):
+    self.x.append(x)
+    self.y.append(y)
+    self.z.append(z)
+    self.product.append(product)
+    self.shelf.append(-1)
+    self.layer.append(-1)
+    return len(self.x) - 1
+
+  def extend(self, products, xs, ys, zs):
+    # Appends many items at once from NumPy arrays, returns their first row
+    first_row = len(self.x)
+    for values, column in ((xs, self.x), (ys, self.y), (zs, self.z)):
+      column.frombytes(memoryview(np.ascontiguousarray(values, dtype=np.float64)).cast('B'))
+    self.product.frombytes(memoryview(np.ascontiguousarray(products, dtype=np.intc)).cast('B'))
+    self.shelf.frombytes(memoryview(np.full(len(products), -1, dtype=np.intc)).cast('B'))
+    self.layer.frombytes(memoryview(np.full(len(products), -1, dtype=np.intc)).cast('B'))
+    return first_row
+
+  def column(self, name):
+    # Zero-copy NumPy view of a column. The store cannot grow while a view
+    # is alive, so do not keep views around across appends.
+    values = getattr(self, name)
+    return np.frombuffer(values, dtype=np.float64 if values.typecode == 'd' else np.intc)
+
+  def shelf_position(self, shelf):
+    if not shelf in self.shelf_positions:
+      self.shelf_positions[shelf] = len(self.shelves)
+      self.shelves.append(shelf)
+    return self.shelf_positions[shelf]
+
+  def get_shelf(self, row):
+    return self.shelves[self.shelf[row]] if self.shelf[row] >= 0 else None
+
+  def set_shelf(self, row, shelf):
+    self.shelf[row] = self.shelf_position(shelf) if shelf else -1
+
+  def get_layer(self, row):
+    return self.get_shelf(row).layers[self.layer[row]] if self.layer[row] >= 0 else None
+
+  def set_layer(self, row, layer):
+    self.layer[row] = self.get_shelf(row).layers.index(layer) if layer else -1
+
+  def item(self, row):
+    return Item(self, row)
+
+class Item:
+  # Lightweight per-item view on one row of an ItemStore
+  __slots__ = ('store', 'row')
+
+  def __init__(self, store, row):
+    self.store = store
+    self.row = row
+
+  @property
+  def name(self):
+    return self.store.product_names[self.store.product[self.row]]
+
+  @property
+  def position(self):
+    return Point(self.store.x[self.row], self.store.y[self.row])
+
+  @property
+  def height(self):
+    return self.store.z[self.row]
+
+  @property
+  def shelf(self):
+    return self.store.get_shelf(self.row)
+
+  @shelf.setter
+  def shelf(self, shelf):
+    self.store.set_shelf(self.row, shelf)
+
+  @property
+  def layer(self):
+    return self.store.get_layer(self.row)
+
+  @layer.setter
+  def layer(self, layer):
+    self.store.set_layer(self.row, layer)
+
+  def __repr__(self):
+    return self.name + str(' at ') + str([self.store.x[self.row], self.store.y[self.row], self.height])
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+from array import array
+import json
+import os
+import numpy as np
+
+# Output sinks for the product locations. Every sink writes one product at a
+# time, so the output tree is never built in memory:
+#   json     the ERP JSON of the parser (product_output gives the value of one
+#            product), same text as json.dump(..., indent=2) of the whole tree
+#   ndjson   one JSON record per product, shelf and layer
+#   columnar numpy .npz with one column per record field, product names,
+#            shelf ids and layer keys as codes into tables of unique values
+
+OUTPUT_FORMATS = ('json', 'ndjson', 'columnar')
+
+def location_records(product):
+  for shelf_id in product.locations:
+    for layer_key in product.locations[shelf_id]:
+      record = {'product': product.name, 'shelf': shelf_id, 'layer': layer_key}
+      record.update(product.locations[shelf_id][layer_key])
+      yield record
+
+def write_json(products, product_output, output):
+  with open(output, 'w') as outfile:
+    written = {}
+    for product in products:
+      if product.name in written:
+        continue
+      outfile.write(',\n  ' if written else '{\n  ')
+      outfile.write(json.dumps(product.name) + ': ' + json.dumps(product_output(product), indent=2).replace('\n', '\n  '))
+      written[product.name] = True
+    outfile.write('\n}' if written else '{}')
+
+def write_ndjson(products, output):
+  with open(output, 'w') as outfile:
+    for product in products:
+      for record in location_records(product):
+        outfile.write(json.dumps(record) + '\n')
+
+def write_columnar(products, output):
+  tables = {'product': {}, 'shelf': {}, 'layer': {}}
+  columns = {'product': array('i'), 'shelf': array('i'), 'layer': array('i'), 'facing': array('i'), 'order': array('i')}
+  for product in products:
+    for record in location_records(product):
+      for field in tables:
+        columns[field].append(tables[field].setdefault(record[field], len(tables[field])))
+      columns['facing'].append(record.get('Facing', -1))
+      columns['order'].append(record.get('Order', -1))
+  arrays = {}
+  for field in columns:
+    arrays[field] = np.frombuffer(columns[field], dtype=np.intc)
+  for field in tables:
+    arrays[field + '_table'] = np.array(list(tables[field]))
+  with open(output, 'wb') as outfile:
+    np.savez_compressed(outfile, **arrays)
+
+def read_columnar(output):
+  # Records of a columnar output, the same as the ndjson records
+  with np.load(output) as data:
+    tables = {}
+    for field in ('product', 'shelf', 'layer'):
+      tables[field] = data[field + '_table'].tolist()
+    columns = [data[field].tolist() for field in ('product', 'shelf', 'layer', 'facing', 'order')]
+  for product, shelf, layer, facing, order in zip(*columns):
+    record = {'product': tables['product'][product], 'shelf': tables['shelf'][shelf], 'layer': tables['layer'][layer]}
+    if facing >= 0:
+      record['Facing'] = facing
+    if order >= 0:
+      record['Order'] = order
+    yield record
+
+def json_records(data):
+  # Records of a parsed ERP JSON of either schema
+  for name in data:
+    if 'locations' in data[name]:
+      for locations in data[name]['locations']:
+        for shelf_id in locations:
+          for layer_key in locations[shelf_id]:
+            record = {'product': name, 'shelf': shelf_id, 'layer': layer_key}
+            record.update(locations[shelf_id][layer_key])
+            yield record
+    else:
+      for shelf in data[name]['Shelves']:
+        for layer in shelf['Layers']:
+          record = {'product': name, 'shelf': shelf['id'], 'layer': layer['id']}
+          for field in layer:
+            if field != 'id':
+              record[field] = layer[field]
+          yield record
+
+def read_records(output):
+  # Records of an output of any format and schema
+  with open(output, 'rb') as infile:
+    columnar = infile.read(2) == b'PK'
+  if columnar:
+    return list(read_columnar(output))
+  with open(output, 'r') as infile:
+    text = infile.read()
+  try:
+    data = json.loads(text)
+  except ValueError:
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+  if 'product' in data and not isinstance(data['product'], dict):
+    return [data]
+  return list(json_records(data))
+
+def write(products, product_output, output, output_format='json'):
+  # Written to output + '.tmp' and renamed, so readers never see a partial output
+  if not output_format in OUTPUT_FORMATS:
+    raise ValueError('Unknown output format ' + str(output_format) + ', expected one of ' + ', '.join(OUTPUT_FORMATS))
+  tmp_output = output + '.tmp'
+  try:
+    if output_format == 'json':
+      write_json(products, product_output, tmp_output)
+    elif output_format == 'ndjson':
+      write_ndjson(products, tmp_output)
+    else:
+      write_columnar(products, tmp_output)
+    os.replace(tmp_output, output)
+  except Exception:
+    if os.path.exists(tmp_output):
+      os.remove(tmp_output)
+    raise
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+import math
+import numpy as np
+
+_EPS = np.finfo(float).eps * 4.0
+
+def yaw_from_quaternions(quaternions):
+  # Rotation angle used for the shelves, for an (n, 4) array of the CSV
+  # rotation columns. Same as euler_from_quaternion(q)[0] of ROS
+  # tf.transformations (static 'sxyz' axes, q read as (x, y, z, w)), which
+  # the parser used before, including its handling of degenerate rotations.
+  q = np.asarray(quaternions, dtype=np.float64).reshape(-1, 4)
+  # Row-wise dot product, summed like numpy.dot so the results are bit-identical
+  nq = np.matmul(q[:, None, :], q[:, :, None])[:, 0, 0]
+  identity = nq < _EPS
+  q = q * np.sqrt(2.0 / np.where(identity, 1.0, nq))[:, None]
+  m00 = 1.0 - q[:, 1] * q[:, 1] - q[:, 2] * q[:, 2]
+  m10 = q[:, 0] * q[:, 1] + q[:, 2] * q[:, 3]
+  m11 = 1.0 - q[:, 0] * q[:, 0] - q[:, 2] * q[:, 2]
+  m12 = q[:, 1] * q[:, 2] - q[:, 0] * q[:, 3]
+  m21 = q[:, 1] * q[:, 2] + q[:, 0] * q[:, 3]
+  m22 = 1.0 - q[:, 0] * q[:, 0] - q[:, 1] * q[:, 1]
+  cy = np.sqrt(m00 * m00 + m10 * m10)
+  y = np.where(cy > _EPS, m21, -m12)
+  x = np.where(cy > _EPS, m22, m11)
+  # math.atan2 rather than numpy.arctan2, which may differ in the last bit
+  yaw = np.array([math.atan2(y_k, x_k) for y_k, x_k in zip(y.tolist(), x.tolist())], dtype=np.float64)
+  yaw[identity] = 0.0
+  return yaw
+
+def yaw_from_quaternion(quaternion):
+  return float(yaw_from_quaternions([quaternion])[0])
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from urllib.parse import unquote
+from output_writers import read_records
+
+# Long-running HTTP service answering location queries from the output of
+# a parser run (any format and schema) without re-reading it per query:
+#   GET /products/<name>                      locations of a product
+#   GET /products/<name>/facings              facings of a product, in total and per location
+#   GET /shelves/<shelf>                      layers of a shelf with their products in order
+#   GET /shelves/<shelf>/layers/<layer>       products of a layer in order
+#   GET /status                               the loaded model
+# Shelf and layer are matched as text, e.g. /shelves/Shelf%205/layers/Layer%203
+# or /shelves/5/layers/3. The output is polled for changes; a new run is
+# loaded in the background and replaces the model once it is complete.
+
+class LocationModel:
+  def __init__(self, records, path=None, mtime=None):
+    self.path = path
+    self.mtime = mtime
+    self.loaded = time.time()
+    self.record_count = len(records)
+    self.products = {}
+    self.layers = {}
+    self.shelves = {}
+    for record in records:
+      location = {'shelf': record['shelf'], 'layer': record['layer'], 'Facing': record.get('Facing'), 'Order': record.get('Order')}
+      self.products.setdefault(record['product'], []).append(location)
+      key = (str(record['shelf']), str(record['layer']))
+      if not key in self.layers:
+        self.layers[key] = []
+        self.shelves.setdefault(key[0], []).append(record['layer'])
+      self.layers[key].append({'product': record['product'], 'Facing': record.get('Facing'), 'Order': record.get('Order')})
+    for key in self.layers:
+      self.layers[key].sort(key=lambda entry: (entry['Order'] is None, entry['Order'], entry['product']))
+
+  def product(self, name):
+    if not name in self.products:
+      return None
+    return {'product': name, 'locations': self.products[name]}
+
+  def facings(self, name):
+    if not name in self.products:
+      return None
+    locations = [{'shelf': location['shelf'], 'layer': location['layer'], 'Facing': location['Facing']} for location in self.products[name]]
+    return {'product': name, 'total': sum(location['Facing'] or 0 for location in locations), 'locations': locations}
+
+  def layer(self, shelf, layer):
+    if not (shelf, layer) in self.layers:
+      return None
+    return {'shelf': shelf, 'layer': layer, 'products': self.layers[(shelf, layer)]}
+
+  def shelf(self, shelf):
+    if not shelf in self.shelves:
+      return None
+    return {'shelf': shelf, 'layers': [{'layer': layer, 'products': self.layers[(shelf, str(layer))]} for layer in self.shelves[shelf]]}
+
+  def status(self):
+    return {'path': self.path, 'mtime': self.mtime, 'loaded': self.loaded, 'records': self.record_count, 'products': len(self.products), 'shelves': len(self.shelves), 'layers': len(self.layers)}
+
+def load_model(path):
+  mtime = os.path.getmtime(path)
+  return LocationModel(read_records(path), path, mtime)
+
+class QueryService:
+  def __init__(self, path, poll_interval=1.0):
+    self.path = path
+    self.poll_interval = poll_interval
+    self.model = load_model(path)
+
+  def query(self, path):
+    # (status, body) of a GET path
+    parts = [unquote(part) for part in path.split('?')[0].strip('/').split('/')]
+    model = self.model
+    result = None
+    if parts == ['status']:
+      result = model.status()
+    elif len(parts) == 2 and parts[0] == 'products':
+      result = model.product(parts[1])
+    elif len(parts) == 3 and parts[0] == 'products' and parts[2] == 'facings':
+      result = model.facings(parts[1])
+    elif len(parts) == 2 and parts[0] == 'shelves':
+      result = model.shelf(parts[1])
+    elif len(parts) == 4 and parts[0] == 'shelves' and parts[2] == 'layers':
+      result = model.layer(parts[1], parts[3])
+    else:
+      return (400, {'error': 'Unknown query ' + path})
+    if result is None:
+      return (404, {'error': 'Not found: ' + path})
+    return (200, result)
+
+  async def handle(self, reader, writer):
+    # HTTP/1.1 with keep-alive, GET only
+    try:
+      while True:
+        request_line = await reader.readline()
+        if not request_line:
+          break
+        headers = {}
+        while True:
+          line = await reader.readline()
+          if not line or line in (b'\r\n', b'\n'):
+            break
+          name, _, value = line.decode('latin-1').partition(':')
+          headers[name.strip().lower()] = value.strip()
+        request = request_line.decode('latin-1').split()
+        if len(request) != 3:
+          break
+        method, path, version = request
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if method != 'GET':
+          status, result = (405, {'error': 'Only GET is supported'})
+          # Skip the request body, so it is not read as the next request;
+          # a chunked or unreadable length ends the connection instead
+          try:
+            length = int(headers.get('content-length', '0'))
+          except ValueError:
+            length = -1
+          if length >= 0 and not 'transfer-encoding' in headers:
+            await reader.readexactly(length)
+          else:
+            keep_alive = False
+        else:
+          status, result = self.query(path)
+        body = json.dumps(result).encode('utf-8')
+        writer.write(('HTTP/1.1 ' + str(status) + ' ' + REASONS[status] + '\r\nContent-Type: application/json\r\nContent-Length: ' + str(len(body)) + '\r\nConnection: ' + ('keep-alive' if keep_alive else 'close') + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        if not keep_alive:
+          break
+    except (ConnectionError, asyncio.IncompleteReadError):
+      pass
+    finally:
+      writer.close()
+
+  async def watch(self):
+    # Reloads the model in a worker thread when the output changes; parser
+    # outputs are renamed into place, so a changed file is a complete run
+    loop = asyncio.get_running_loop()
+    failed_mtime = False
+    while True:
+      await asyncio.sleep(self.poll_interval)
+      mtime = None
+      try:
+        mtime = os.path.getmtime(self.path)
+        if mtime != self.model.mtime and mtime != failed_mtime:
+          self.model = await loop.run_in_executor(None, load_model, self.path)
+          print('Loaded ' + self.path + ' with ' + str(self.model.record_count) + ' locations')
+      except Exception as e:
+        # Whatever is wrong with the output, the watcher has to survive it to
+        # load the next run; a broken output is only reported once
+        if mtime != failed_mtime:
+          print('Could not load ' + self.path + ', keeping the current model: ' + repr(e))
+        failed_mtime = mtime
+
+  async def serve(self, host='127.0.0.1', port=8080, unix_socket=None):
+    if unix_socket:
+      server = await asyncio.start_unix_server(self.handle, path=unix_socket)
+      print('Serving ' + self.path + ' on ' + unix_socket)
+    else:
+      server = await asyncio.start_server(self.handle, host, port)
+      print('Serving ' + self.path + ' on http://' + host + ':' + str(port))
+    watcher = asyncio.ensure_future(self.watch())
+    try:
+      async with server:
+        await server.serve_forever()
+    finally:
+      watcher.cancel()
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('output', nargs='?', default='output/ERP.json', help='parser output to serve, reloaded when it changes')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8080)
+  parser.add_argument('--socket', help='serve on this Unix socket instead of TCP')
+  parser.add_argument('--poll', type=float, default=1.0, help='seconds between checks of the output for a new run')
+  args = parser.parse_args()
+  service = QueryService(args.output, args.poll)
+  try:
+    asyncio.run(service.serve(args.host, args.port, args.socket))
+  except KeyboardInterrupt:
+    pass
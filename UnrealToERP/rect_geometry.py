@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+# Point-in-shelf tests without shapely. Every shelf is an oriented rectangle,
+# so the item coordinates are taken into the shelf frame spanned by its
+# corners (p1 -> p2 along the width, p1 -> p4 along the depth) and a point is
+# inside when it lies strictly on the inner side of all four edges, which is
+# the strict interior test of Polygon.contains.
+
+class ShelfFrames:
+  def __init__(self, shelves):
+    corners = np.array([shelf.corners for shelf in shelves], dtype=np.float64).reshape(-1, 4, 2)
+    self.x = corners[:, :, 0]
+    self.y = corners[:, :, 1]
+    # Edge i runs from corner i to corner i+1
+    self.edge_x = np.roll(self.x, -1, axis=1) - self.x
+    self.edge_y = np.roll(self.y, -1, axis=1) - self.y
+
+  def to_local(self, shelf_idx, xs, ys):
+    # Signed offsets of the points from the four shelf edges
+    dx = xs[:, None] - self.x[shelf_idx]
+    dy = ys[:, None] - self.y[shelf_idx]
+    return self.edge_x[shelf_idx] * dy - self.edge_y[shelf_idx] * dx
+
+  def contains(self, shelf_idx, xs, ys):
+    shelf_idx = np.asarray(shelf_idx, dtype=np.intp)
+    offsets = self.to_local(shelf_idx, np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))
+    return np.all(offsets > 0, axis=1) | np.all(offsets < 0, axis=1)
+
+  def distance(self, shelf_idx, xs, ys):
+    # Euclidean distance from the points to the shelf rectangles, 0 inside
+    shelf_idx = np.asarray(shelf_idx, dtype=np.intp)
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    dx = xs[:, None] - self.x[shelf_idx]
+    dy = ys[:, None] - self.y[shelf_idx]
+    edge_x = self.edge_x[shelf_idx]
+    edge_y = self.edge_y[shelf_idx]
+    t = np.clip((dx * edge_x + dy * edge_y) / (edge_x * edge_x + edge_y * edge_y), 0.0, 1.0)
+    distance = np.hypot(dx - t * edge_x, dy - t * edge_y).min(axis=1)
+    distance[self.contains(shelf_idx, xs, ys)] = 0.0
+    return distance
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import json
+import os
+import struct
+from array import array
+import numpy as np
+
+# Binary columnar form of an Unreal export (items or shelves CSV), converted
+# once and then memory-mapped by the parser instead of re-parsing the CSV:
+#
+#   header      magic, format version, row count, offset and length of the
+#               name dictionary (little endian)
+#   x, y, z     float64 columns of the position
+#   quaternion  float64 (rows, 4), the four rotation columns in CSV order
+#   name        int32 codes into the name dictionary
+#   movability  int32, -1 where the CSV has none
+#   names       the name dictionary as a JSON list, in order of appearance
+#
+# Columns start at multiples of 8 bytes. The header row of a CSV is dropped.
+
+MAGIC = b'ERPSCENE'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sIIQQQ')
+HEADER_SIZE = 64
+
+def column_offsets(rows):
+  # Byte offset of every column and the end of the columns
+  offsets = {}
+  offset = HEADER_SIZE
+  for name, width in (('x', 8), ('y', 8), ('z', 8), ('quaternion', 32), ('name', 4), ('movability', 4)):
+    offsets[name] = offset
+    offset += (rows * width + 7) // 8 * 8
+  return (offsets, offset)
+
+def is_scene(path):
+  try:
+    with open(path, 'rb') as scene_file:
+      return scene_file.read(len(MAGIC)) == MAGIC
+  except (IOError, OSError):
+    return False
+
+def convert(csv_path, scene_path):
+  # Converts an export CSV, returns the number of rows
+  columns = {'x': array('d'), 'y': array('d'), 'z': array('d'), 'quaternion': array('d'), 'name': array('i'), 'movability': array('i')}
+  codes = {}
+  with open(csv_path, mode='r') as csv_file:
+    csv_reader = csv.reader(csv_file, delimiter='|')
+    for data in csv_reader:
+      if not data:
+        continue
+      try:
+        position = (float(data[1]), float(data[2]), float(data[3]))
+      except ValueError:
+        if not len(columns['x']):
+          continue
+        raise
+      columns['x'].append(position[0])
+      columns['y'].append(position[1])
+      columns['z'].append(position[2])
+      columns['quaternion'].extend([float(value) for value in data[4:8]])
+      columns['name'].append(codes.setdefault(str(data[0]), len(codes)))
+      columns['movability'].append(int(data[8]) if len(data) > 8 and data[8].strip() else -1)
+  rows = len(columns['x'])
+  offsets, end = column_offsets(rows)
+  names = json.dumps(list(codes)).encode('utf-8')
+  tmp_path = scene_path + '.tmp'
+  with open(tmp_path, 'wb') as scene_file:
+    scene_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, rows, end, len(names)).ljust(HEADER_SIZE, b'\0'))
+    for name in ('x', 'y', 'z', 'quaternion', 'name', 'movability'):
+      scene_file.seek(offsets[name])
+      columns[name].tofile(scene_file)
+    scene_file.seek(end)
+    scene_file.write(names)
+  os.replace(tmp_path, scene_path)
+  return rows
+
+class Scene:
+  # Read-only memory-mapped columns of a scene file
+  def __init__(self, path):
+    with open(path, 'rb') as scene_file:
+      magic, version, _, rows, names_offset, names_length = HEADER.unpack(scene_file.read(HEADER.size))
+      if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(path + ' is not a scene file of format version ' + str(FORMAT_VERSION))
+      scene_file.seek(names_offset)
+      self.names = json.loads(scene_file.read(names_length).decode('utf-8'))
+    self.path = path
+    self.rows = rows
+    offsets, end = column_offsets(rows)
+    data = np.memmap(path, dtype=np.uint8, mode='r', shape=(end,)) if rows else np.zeros(end, dtype=np.uint8)
+    self.x = data[offsets['x']:offsets['x'] + rows * 8].view(np.float64)
+    self.y = data[offsets['y']:offsets['y'] + rows * 8].view(np.float64)
+    self.z = data[offsets['z']:offsets['z'] + rows * 8].view(np.float64)
+    self.quaternion = data[offsets['quaternion']:offsets['quaternion'] + rows * 32].view(np.float64).reshape(rows, 4)
+    self.name = data[offsets['name']:offsets['name'] + rows * 4].view(np.int32)
+    self.movability = data[offsets['movability']:offsets['movability'] + rows * 4].view(np.int32)
+
+  def __len__(self):
+    return self.rows
+
+  def rows_as_csv(self):
+    # Rows like csv.reader gives them, with numbers instead of strings
+    quaternions = self.quaternion.tolist()
+    movability = self.movability.tolist()
+    for k, (code, x, y, z) in enumerate(zip(self.name.tolist(), self.x.tolist(), self.y.tolist(), self.z.tolist())):
+      yield [self.names[code], x, y, z] + quaternions[k] + [movability[k] if movability[k] >= 0 else '']
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Convert an Unreal export CSV into a scene file the parsers open instead of the CSV')
+  parser.add_argument('csv', help='items or shelves CSV')
+  parser.add_argument('scene', help='scene file to write')
+  args = parser.parse_args()
+  print('Converted ' + str(convert(args.csv, args.scene)) + ' rows of ' + args.csv + ' to ' + args.scene)
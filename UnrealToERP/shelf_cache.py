@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import glob
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Bump whenever the shelf model built by csv_to_shelves changes, so cached
+# models of older parser versions are not used and get evicted
+PARSER_VERSION = 3
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'erp_unreal_parser')
+DEFAULT_MAX_ENTRIES = 32
+
+def cache_key(csv_shelves, build, backend):
+  # Hash of the shelf CSV content, the parser that builds the model and its
+  # options. The parser is named by its file and function, not its module,
+  # which is __main__ when the parser runs as a script.
+  digest = hashlib.sha256()
+  with open(csv_shelves, mode='rb') as csv_file:
+    for chunk in iter(lambda: csv_file.read(1 << 20), b''):
+      digest.update(chunk)
+  digest.update(('|' + os.path.basename(build.__code__.co_filename) + '|' + build.__qualname__ + '|' + backend).encode('utf-8'))
+  return 'v' + str(PARSER_VERSION) + '-' + digest.hexdigest()
+
+def build_shelf_model(csv_shelves, build, backend='shapely'):
+  # The index build matched the boards with is the one the items are located with
+  return build(csv_shelves, backend=backend, with_index=True)
+
+def load_shelves(csv_shelves, build, backend='shapely', cache_dir=None, max_entries=DEFAULT_MAX_ENTRIES):
+  # Shelves and their ShelfIndex for csv_shelves, built with build (a
+  # csv_to_shelves function) or loaded from the on-disk cache. Every call
+  # returns a fresh copy, as fill() and calc_orders() modify the model.
+  if cache_dir is None:
+    cache_dir = DEFAULT_CACHE_DIR
+  path = os.path.join(cache_dir, cache_key(csv_shelves, build, backend) + '.pickle')
+  if os.path.exists(path):
+    try:
+      with open(path, mode='rb') as cache_file:
+        model = pickle.load(cache_file)
+      os.utime(path, None)
+      return model
+    except Exception as e:
+      print('Cached shelf model ' + path + ' could not be loaded, rebuilding it: ' + str(e))
+  model = build_shelf_model(csv_shelves, build, backend)
+  try:
+    save(model, path)
+    evict(cache_dir, max_entries)
+  except (IOError, OSError) as e:
+    print('Shelf model could not be cached at ' + path + ': ' + str(e))
+  return model
+
+def save(model, path):
+  # Write to a temporary file first, so concurrent runs never read half a model
+  directory = os.path.dirname(os.path.abspath(path))
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  handle, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+  try:
+    with os.fdopen(handle, 'wb') as cache_file:
+      pickle.dump(model, cache_file, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+  except Exception:
+    os.remove(tmp_path)
+    raise
+
+def evict(cache_dir, max_entries=DEFAULT_MAX_ENTRIES):
+  # Drop models of other parser versions and all but the max_entries most recently used
+  entries = glob.glob(os.path.join(cache_dir, 'v*-*.pickle'))
+  current = [path for path in entries if os.path.basename(path).startswith('v' + str(PARSER_VERSION) + '-')]
+  stale = [path for path in entries if not path in current]
+  current.sort(key=os.path.getmtime, reverse=True)
+  for path in stale + current[max_entries:]:
+    try:
+      os.remove(path)
+    except OSError:
+      pass
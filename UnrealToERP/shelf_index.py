@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+import math
+import numpy as np
+from shapely.geometry import Point
+from rect_geometry import ShelfFrames
+import instrumentation
+
+GEOMETRY_BACKENDS = ('shapely', 'numpy')
+
+class ShelfIndex:
+  # Uniform grid over the shelf bounding boxes. Every shelf is registered in
+  # all cells its bounding box touches, so a point only has to be tested
+  # against the few shelves registered in its own cell.
+  def __init__(self, shelves, cell_size=None, backend='shapely'):
+    if not backend in GEOMETRY_BACKENDS:
+      raise ValueError('Unknown geometry backend ' + str(backend) + ', expected one of ' + str(GEOMETRY_BACKENDS))
+    self.backend = backend
+    self.shelves = list(shelves)
+    self.positions = {}
+    for i, shelf in enumerate(self.shelves):
+      self.positions[shelf] = i
+    self.bounds = [shelf.bounds for shelf in self.shelves]
+    if cell_size is None:
+      cell_size = self.default_cell_size()
+    self.cell_size = cell_size
+    self.cells = {}
+    for i, bound in enumerate(self.bounds):
+      i_min, j_min = self.cell(bound[0], bound[1])
+      i_max, j_max = self.cell(bound[2], bound[3])
+      for i_cell in range(i_min, i_max + 1):
+        for j_cell in range(j_min, j_max + 1):
+          self.cells.setdefault((i_cell, j_cell), []).append(i)
+    if self.cells:
+      self.i_min = min(cell[0] for cell in self.cells)
+      self.i_max = max(cell[0] for cell in self.cells)
+      self.j_min = min(cell[1] for cell in self.cells)
+      self.j_max = max(cell[1] for cell in self.cells)
+    self.frames = None
+    if backend == 'numpy':
+      self.frames = ShelfFrames(self.shelves)
+
+  def default_cell_size(self):
+    # Mean bounding box extent, so a shelf spans only a handful of cells
+    extents = [max(bound[2] - bound[0], bound[3] - bound[1]) for bound in self.bounds]
+    extents = [extent for extent in extents if extent > 0]
+    if not extents:
+      return 1.0
+    return sum(extents) / len(extents)
+
+  def cell(self, x, y):
+    return (int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size)))
+
+  def candidates(self, x, y):
+    # Shelves whose bounding box cell matches (x, y), in the order of self.shelves
+    return [self.shelves[i] for i in self.cells.get(self.cell(x, y), [])]
+
+  def containing(self, point):
+    return [shelf for shelf in self.candidates(point.x, point.y) if shelf.polygon.contains(point)]
+
+  def locate(self, xs, ys):
+    # Shelves containing each of the points (xs[k], ys[k])
+    xs = np.asarray(xs, dtype=np.float64).tolist()
+    ys = np.asarray(ys, dtype=np.float64).tolist()
+    if self.backend == 'numpy':
+      return self.locate_numpy(xs, ys)
+    return [self.containing(Point(x, y)) for x, y in zip(xs, ys)]
+
+  def locate_numpy(self, xs, ys):
+    point_idx = []
+    shelf_idx = []
+    for k, (x, y) in enumerate(zip(xs, ys)):
+      for i in self.cells.get(self.cell(x, y), []):
+        point_idx.append(k)
+        shelf_idx.append(i)
+    located = [[] for _ in range(len(xs))]
+    if not point_idx:
+      return located
+    point_idx = np.array(point_idx, dtype=np.intp)
+    shelf_idx = np.array(shelf_idx, dtype=np.intp)
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    inside = self.frames.contains(shelf_idx, xs[point_idx], ys[point_idx])
+    for k, i in zip(point_idx[inside].tolist(), shelf_idx[inside].tolist()):
+      located[k].append(self.shelves[i])
+    return located
+
+  def distances(self, shelf_idx, xs, ys):
+    if self.backend == 'numpy':
+      return self.frames.distance(shelf_idx, xs, ys).tolist()
+    return [self.shelves[i].polygon.distance(Point(x, y)) for i, x, y in zip(shelf_idx, xs, ys)]
+
+  def ring(self, i_center, j_center, r):
+    # Cells at Chebyshev distance r from the center cell, clipped to the grid
+    for i_cell in range(max(i_center - r, self.i_min), min(i_center + r, self.i_max) + 1):
+      if i_cell == i_center - r or i_cell == i_center + r:
+        j_cells = range(max(j_center - r, self.j_min), min(j_center + r, self.j_max) + 1)
+      else:
+        j_cells = [j for j in (j_center - r, j_center + r) if self.j_min <= j <= self.j_max]
+      for j_cell in j_cells:
+        yield (i_cell, j_cell)
+
+  def nearest(self, xs, ys, max_distance=float('inf')):
+    # Nearest shelf and its distance for each point, (None, inf) if no shelf
+    # is within max_distance. The grid rings around each point are searched
+    # outwards until no unseen shelf can be closer than the best one found;
+    # ties go to the shelf that comes first in self.shelves.
+    xs = np.asarray(xs, dtype=np.float64).tolist()
+    ys = np.asarray(ys, dtype=np.float64).tolist()
+    nearest = [(None, float('inf'))] * len(xs)
+    if not self.shelves:
+      return nearest
+    best = [(float('inf'), -1)] * len(xs)
+    seen = [set() for _ in range(len(xs))]
+    cells = [self.cell(x, y) for x, y in zip(xs, ys)]
+    active = list(range(len(xs)))
+    r = 0
+    while active:
+      point_idx = []
+      shelf_idx = []
+      for k in active:
+        for cell in self.ring(cells[k][0], cells[k][1], r):
+          for i in self.cells.get(cell, []):
+            if not i in seen[k]:
+              seen[k].add(i)
+              point_idx.append(k)
+              shelf_idx.append(i)
+      distances = self.distances(shelf_idx, [xs[k] for k in point_idx], [ys[k] for k in point_idx])
+      for k, i, distance in zip(point_idx, shelf_idx, distances):
+        if (distance, i) < best[k]:
+          best[k] = (distance, i)
+      still_active = []
+      for k in active:
+        i_center, j_center = cells[k]
+        # Every shelf outside the searched block of cells is at least this far away
+        bound = min(xs[k] - (i_center - r) * self.cell_size, (i_center + r + 1) * self.cell_size - xs[k],
+                    ys[k] - (j_center - r) * self.cell_size, (j_center + r + 1) * self.cell_size - ys[k])
+        covered = i_center - r <= self.i_min and i_center + r >= self.i_max and j_center - r <= self.j_min and j_center + r >= self.j_max
+        if not (best[k][0] < bound or bound > max_distance or covered):
+          still_active.append(k)
+      active = still_active
+      r += 1
+    for k, (distance, i) in enumerate(best):
+      if i >= 0 and distance <= max_distance:
+        nearest[k] = (self.shelves[i], distance)
+    return nearest
+
+  def sort_shelves(self, shelves):
+    shelves.sort(key=lambda shelf: self.positions[shelf])
+
+  def nearest_shelves(self, xs, ys, describe, fix_unlocated=False, max_distance=float('inf')):
+    # Reports the unlocated points (xs[k], ys[k]) with their nearest shelf,
+    # describe(k) gives the item of point k. Returns the shelf every point
+    # moves to, None unless fix_unlocated and a shelf is within max_distance.
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    instrumentation.count('items unlocated', len(xs))
+    moved = [None] * len(xs)
+    for k, (nearest_shelf, nearest_dist) in enumerate(self.nearest(xs, ys, max_distance)):
+      if not nearest_shelf:
+        instrumentation.event('unlocated item', 'Item ' + describe(k) + ' is unlocated, no shelf within distance ' + str(max_distance))
+        continue
+      instrumentation.event('unlocated item', 'Item ' + describe(k) + ' is unlocated, nearest shelf is ' + str(nearest_shelf.id) + ' located at ' + str(nearest_shelf.center) + ', distance ' + str(nearest_dist))
+      if fix_unlocated:
+        instrumentation.count('items moved to nearest shelf')
+        instrumentation.event('unlocated item', 'Item ' + describe(k) + ' will be located at shelf ' + str(nearest_shelf.id))
+        moved[k] = nearest_shelf
+    return moved
+
+def resolve_conflicts(located, describe, first_wins=True):
+  # Shelf of every point from the shelves containing it (ShelfIndex.locate),
+  # None if there is none: the first one, or the last unless first_wins.
+  # describe(k) gives the item of point k for the conflict messages.
+  assigned = [None] * len(located)
+  conflicts = 0
+  for k, candidates in enumerate(located):
+    if len(candidates) > 1:
+      conflicts += 1
+    for shelf in candidates:
+      if first_wins and assigned[k]:
+        instrumentation.event('multi-shelf conflict', 'Item ' + describe(k) + ' was located at shelf ' + str(assigned[k].id) + ', but is also in shelf ' + str(shelf.id))
+      else:
+        assigned[k] = shelf
+  instrumentation.count('items located', len(located) - assigned.count(None))
+  instrumentation.count('multi-shelf conflicts', conflicts)
+  return assigned
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import numpy as np
+from quaternion import yaw_from_quaternions
+
+# Geometry of all shelves of a scene as arrays, row i for shelf i: centers,
+# yaw, half extents (width / 2, depth / 2), the corners p1..p4 of the
+# rectangle and the side line through p2 and p3 as a unit normal and offset.
+# The side distance of a point is then |normal . point - offset|, which
+# unlike a slope and intercept needs no special case for vertical lines.
+# Shapely polygons are only built by the shelves that are asked for one.
+
+# Local (width, depth) signs of the corners p1..p4
+CORNER_SIGNS = np.array([(-1.0, -1.0), (1.0, -1.0), (1.0, 1.0), (-1.0, 1.0)])
+
+def transform2d(x_trans, y_trans, x_rot, y_rot, c, s):
+  # engine.transform2d for arrays, with the cosine and sine of the yaw
+  return (x_rot * c + y_rot * s + x_trans, -x_rot * s + y_rot * c + y_trans)
+
+class ShelfTable:
+  def __init__(self, centers, yaw, depth, width):
+    self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    self.yaw = np.asarray(yaw, dtype=np.float64).reshape(-1)
+    depth = np.asarray(depth, dtype=np.float64).reshape(-1)
+    width = np.asarray(width, dtype=np.float64).reshape(-1)
+    self.half_extents = np.stack((width / 2, depth / 2), axis=1)
+    c = np.cos(self.yaw)
+    s = np.sin(self.yaw)
+    local = CORNER_SIGNS[None, :, :] * self.half_extents[:, None, :]
+    x, y = transform2d(self.centers[:, 0, None], self.centers[:, 1, None], local[:, :, 0], local[:, :, 1], c[:, None], s[:, None])
+    self.corners = np.stack((x, y), axis=2)
+    # The side line runs along the depth axis (s, c), its normal is the width axis
+    norm = np.hypot(c, s)
+    normals = np.stack((c / norm, -s / norm), axis=1)
+    self.side_lines = np.concatenate((normals, np.sum(normals * self.corners[:, 1, :], axis=1)[:, None]), axis=1)
+
+  def __len__(self):
+    return len(self.yaw)
+
+  def bounds(self, i):
+    # (min x, min y, max x, max y) like Polygon.bounds
+    corners = self.corners[i]
+    return tuple(corners.min(axis=0).tolist() + corners.max(axis=0).tolist())
+
+def side_line_table(shelves):
+  # Side lines of the shelves, which may come from several tables, as an (n, 3) array
+  return np.array([shelf.side_line for shelf in shelves], dtype=np.float64).reshape(-1, 3)
+
+def footprint_table(rows, footprints):
+  # Table of the footprints (k, depth, width, side) of the ShelfSystem rows:
+  # the footprint has the center of rows[k], moved to the front (side 1) or
+  # back (side -1) half of a gondola, in the same steps as the scalar code
+  rows = [rows[k] for k, depth, width, side in footprints]
+  depth = np.array([footprint[1] for footprint in footprints], dtype=np.float64)
+  width = np.array([footprint[2] for footprint in footprints], dtype=np.float64)
+  side = np.array([footprint[3] for footprint in footprints], dtype=np.intc)
+  x = np.array([float(data[1]) for data in rows], dtype=np.float64)
+  y = np.array([float(data[2]) for data in rows], dtype=np.float64)
+  yaw = yaw_from_quaternions([[float(value) for value in data[4:8]] for data in rows])
+  c = np.cos(yaw)
+  s = np.sin(yaw)
+  front_x, front_y = transform2d(x, y, 0.0, depth / 2, c, s)
+  back_x, back_y = transform2d(front_x, front_y, 0.0, -depth, c, s)
+  x = np.where(side == 1, front_x, np.where(side == -1, back_x, x))
+  y = np.where(side == 1, front_y, np.where(side == -1, back_y, y))
+  return ShelfTable(np.stack((x, y), axis=1), yaw, depth, width)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+import multiprocessing
+import numpy as np
+from facings import FACING_TOLERANCE, cluster_distances, calc_side_distances
+from shelf_table import side_line_table
+
+# Layers, facings and orders of one shelf only depend on the items assigned
+# to that shelf, so after fill() the items are partitioned by shelf and every
+# shelf is computed by compute_shelf, serially or on a process pool. The
+# results are merged into the products and shelves exactly as
+# Product.calc_layers, Product.calc_facings and Shelf.calc_orders do.
+
+def shelf_tasks(store, tolerance=FACING_TOLERANCE, shelf_positions=None):
+  # One task per shelf with items (or per shelf in shelf_positions): the layer
+  # bounds of the shelf and the rows, product indices, side distances and
+  # heights of its items. The side distances of all items are computed at once.
+  shelf_idx = store.column('shelf')
+  if shelf_positions is None:
+    rows = np.flatnonzero(shelf_idx >= 0)
+  else:
+    rows = np.flatnonzero(np.isin(shelf_idx, list(shelf_positions)))
+  rows = rows[np.argsort(shelf_idx[rows], kind='stable')]
+  bounds = np.flatnonzero(np.diff(shelf_idx[rows])) + 1
+  side_distances = calc_side_distances(store.column('x')[rows], store.column('y')[rows], side_line_table(store.shelves)[shelf_idx[rows]])
+  z = store.column('z')
+  product = store.column('product')
+  tasks = []
+  start = 0
+  for shelf_rows in np.split(rows, bounds):
+    if len(shelf_rows):
+      shelf = store.shelves[shelf_idx[shelf_rows[0]]]
+      tasks.append((shelf_idx[shelf_rows[0]], shelf.layer_bounds, tolerance, shelf_rows, product[shelf_rows], side_distances[start:start + len(shelf_rows)], z[shelf_rows]))
+    start += len(shelf_rows)
+  return tasks
+
+def compute_shelf(task):
+  # Layer of every item, facing clusters per (product, layer) and the order
+  # of every product on its layers, for one shelf
+  shelf, layer_bounds, tolerance, rows, products, side_distances, zs = task
+  layers = np.searchsorted(layer_bounds, zs, side='right') - 1
+  located = np.flatnonzero(layers >= 0)
+  # Group by (layer, product) with every group in item order
+  located = located[np.lexsort((located, products[located], layers[located]))]
+  keys = np.stack((layers[located], products[located]), axis=1)
+  bounds = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+  locations = []
+  for group in np.split(located, bounds):
+    if len(group):
+      locations.append([int(layers[group[0]]), int(products[group[0]]), int(rows[group[0]]), cluster_distances(side_distances[group], tolerance), 0])
+  # Orders: all facings of a layer sorted by distance, the last facing of a product gives its order
+  orders_sorted = {}
+  for location in locations:
+    for facing in location[3]:
+      orders_sorted.setdefault(location[0], []).append((location[1], facing[0]))
+  orders = {}
+  for layer in orders_sorted:
+    orders_sorted[layer].sort(key=lambda x: x[1])
+    for i, order_sorted in enumerate(orders_sorted[layer]):
+      orders[(layer, order_sorted[0])] = i+1
+  for location in locations:
+    location[4] = orders[(location[0], location[1])]
+  return (shelf, layers, locations, orders_sorted)
+
+def run_tasks(tasks, workers=None):
+  if workers == 1 or len(tasks) < 2:
+    return [compute_shelf(task) for task in tasks]
+  pool = multiprocessing.Pool(workers)
+  try:
+    return pool.map(compute_shelf, tasks, chunksize=max(1, len(tasks) // (4 * (workers or multiprocessing.cpu_count()))))
+  finally:
+    pool.close()
+    pool.join()
+
+def calc_locations(products, layer_key, workers=None, tolerance=FACING_TOLERANCE):
+  # workers=None uses all cores, workers=1 computes in this process. Returns
+  # the per shelf results, which incremental runs reuse.
+  if not products:
+    return []
+  store = products[0].store
+  tasks = shelf_tasks(store, tolerance)
+  results = run_tasks(tasks, workers)
+  set_layers(store, tasks, results)
+  merge_results(products, results, layer_key)
+  return results
+
+def set_layers(store, tasks, results):
+  layer_column = store.column('layer')
+  for task, result in zip(tasks, results):
+    layer_column[task[3]] = result[1]
+  del layer_column
+
+def merge_results(products, results, layer_key):
+  store = products[0].store
+  products_by_index = {}
+  for product in products:
+    products_by_index[product.index] = product
+  entries = []
+  for shelf_position, layers, locations, orders_sorted in results:
+    shelf = store.shelves[shelf_position]
+    first_rows = {}
+    for layer, product, first_row, clusters, order in locations:
+      if not product in first_rows or first_row < first_rows[product]:
+        first_rows[product] = first_row
+    for layer, product, first_row, clusters, order in locations:
+      entries.append((product, first_rows[product], first_row, shelf, layer, clusters, order))
+    for layer in orders_sorted:
+      shelf.layers[layer].orders_sorted = [(products_by_index[product], distance) for product, distance in orders_sorted[layer]]
+  # Same insertion order of shelves and layers in product.locations and of
+  # products in layer.orders as the per product computation
+  entries.sort(key=lambda entry: entry[:3])
+  for product, shelf_first_row, first_row, shelf, layer, clusters, order in entries:
+    product = products_by_index[product]
+    layer = shelf.layers[layer]
+    layer.orders[product] = clusters
+    if not shelf.id in product.locations:
+      product.locations[shelf.id] = {}
+    product.locations[shelf.id][layer_key(layer)] = {}
+    product.locations[shelf.id][layer_key(layer)]['Facing'] = len(clusters)
+    product.locations[shelf.id][layer_key(layer)]['Order'] = order
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+import csv
+import numpy as np
+from facings import FACING_TOLERANCE, cluster_distances, merge_clusters, calc_side_distances
+from item_store import ItemStore
+from scene_format import Scene, is_scene
+from shelf_index import resolve_conflicts
+
+DEFAULT_CHUNK_SIZE = 100000
+
+def read_chunks(csv_items, chunk_size=DEFAULT_CHUNK_SIZE, skip_header=False):
+  # Items CSV as (names, x, y, z) chunks of at most chunk_size rows. Chunks
+  # of a scene file are views of its memory-mapped columns.
+  if is_scene(csv_items):
+    scene = Scene(csv_items)
+    for start in range(0, len(scene), chunk_size):
+      end = start + chunk_size
+      yield ([scene.names[code] for code in scene.name[start:end].tolist()], scene.x[start:end], scene.y[start:end], scene.z[start:end])
+    return
+  with open(csv_items, mode='r') as csv_file:
+    csv_reader = csv.reader(csv_file, delimiter='|')
+    if skip_header:
+      next(csv_reader)
+    names = []
+    coordinates = []
+    for data in csv_reader:
+      names.append(str(data[0]))
+      coordinates.append((float(data[1]), float(data[2]), float(data[3])))
+      if len(names) == chunk_size:
+        yield to_chunk(names, coordinates)
+        names = []
+        coordinates = []
+    if names:
+      yield to_chunk(names, coordinates)
+
+def to_chunk(names, coordinates):
+  coordinates = np.array(coordinates, dtype=np.float64).reshape(-1, 3)
+  return (names, coordinates[:, 0], coordinates[:, 1], coordinates[:, 2])
+
+class StreamAggregator:
+  # Assigns chunks of items to shelves and layers as they arrive and keeps
+  # only per (product, shelf, layer) facing clusters, in layer.orders, and
+  # the product locations. Gives the same result as fill(), calc_layers()
+  # and calc_facings() on the whole export, without holding the items.
+  def __init__(self, shelves, index, product_class, layer_key, first_wins=True, fix_unlocated=False, max_distance=float('inf'), tolerance=FACING_TOLERANCE):
+    self.shelves = shelves
+    self.index = index
+    self.product_class = product_class
+    self.layer_key = layer_key
+    self.first_wins = first_wins
+    self.fix_unlocated = fix_unlocated
+    self.max_distance = max_distance
+    self.tolerance = tolerance
+    self.store = ItemStore()
+    self.products = []
+    self.products_by_name = {}
+    self.layers = {}
+    self.item_count = 0
+
+  def product(self, name):
+    if not name in self.products_by_name:
+      self.products_by_name[name] = self.product_class(name, self.store)
+      self.products.append(self.products_by_name[name])
+    return self.products_by_name[name]
+
+  def add_chunk(self, names, xs, ys, zs):
+    self.item_count += len(names)
+    for name in names:
+      self.product(name)
+    describe = lambda k: item_repr(names[k], xs[k], ys[k], zs[k])
+    item_shelves = resolve_conflicts(self.index.locate(xs, ys), describe, self.first_wins)
+    unlocated = [k for k, shelf in enumerate(item_shelves) if shelf is None]
+    moved = self.index.nearest_shelves(xs[unlocated], ys[unlocated], lambda k: describe(unlocated[k]), self.fix_unlocated, self.max_distance)
+    for k, nearest_shelf in zip(unlocated, moved):
+      item_shelves[k] = nearest_shelf
+    rows_by_shelf = {}
+    for k, shelf in enumerate(item_shelves):
+      if shelf:
+        rows_by_shelf.setdefault(shelf, []).append(k)
+        product = self.product(names[k])
+        if not product in shelf.products:
+          shelf.products.append(product)
+        if not shelf in product.shelves:
+          product.shelves.append(shelf)
+    item_layers = [-1] * len(names)
+    for shelf in rows_by_shelf:
+      rows = rows_by_shelf[shelf]
+      for k, i in zip(rows, shelf.find_layers(zs[rows]).tolist()):
+        item_layers[k] = i
+    rows_by_layer = {}
+    for k, shelf in enumerate(item_shelves):
+      if item_layers[k] >= 0:
+        product = self.product(names[k])
+        layer = shelf.layers[item_layers[k]]
+        if not shelf.id in product.locations:
+          product.locations[shelf.id] = {}
+        if not self.layer_key(layer) in product.locations[shelf.id]:
+          product.locations[shelf.id][self.layer_key(layer)] = {}
+        rows_by_layer.setdefault((product, shelf, layer), []).append(k)
+    for product, shelf, layer in rows_by_layer:
+      rows = rows_by_layer[(product, shelf, layer)]
+      clusters = cluster_distances(calc_side_distances(xs[rows], ys[rows], shelf.side_line), self.tolerance)
+      layer.orders[product] = merge_clusters(layer.orders.get(product, []), clusters, self.tolerance)
+      self.layers[(product, shelf, layer)] = True
+
+  def finish(self):
+    # Facing counts from the merged clusters, and the product and shelf
+    # lists in the order a run over the whole export produces them
+    positions = {}
+    for i, product in enumerate(self.products):
+      positions[product] = i
+    touched_layers = {}
+    for product, shelf, layer in self.layers:
+      product.locations[shelf.id][self.layer_key(layer)] = {}
+      product.locations[shelf.id][self.layer_key(layer)]['Facing'] = len(layer.orders[product])
+      touched_layers[layer] = True
+    for layer in touched_layers:
+      layer.orders = dict(sorted(layer.orders.items(), key=lambda order: positions[order[0]]))
+    for shelf in self.shelves:
+      shelf.products.sort(key=lambda product: positions[product])
+    for product in self.products:
+      self.index.sort_shelves(product.shelves)
+    return self.products
+
+def item_repr(name, x, y, z):
+  return name + ' at ' + str([float(x), float(y), float(z)])